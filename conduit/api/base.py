@@ -1,16 +1,35 @@
-import json
+import re
+import datetime
+import hashlib
 import six
+from functools import partial
+from itertools import islice
 
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.urlresolvers import reverse, NoReverseMatch
+from django.core.urlresolvers import reverse, NoReverseMatch, get_script_prefix, get_urlconf
 from django.db.models.fields import FieldDoesNotExist
-from django.db import models
-from django.contrib.contenttypes.fields import GenericForeignKey
-from django.conf.urls import url
+from django.db import models, connections, router
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils import timezone
+# Django 1.10 made prefetch_related_objects public with *lookups
+try:
+    from django.db.models import prefetch_related_objects
+except ImportError:
+    from django.db.models.query import prefetch_related_objects as _prefetch_related_objects
 
-from decimal import Decimal
-from dateutil import parser
+    def prefetch_related_objects(model_instances, *related_lookups):
+        _prefetch_related_objects(model_instances, related_lookups)
+# Conditional expressions are new in Django 1.8
+try:
+    from django.db.models import Case, When, Value
+except ImportError:
+    Case = None
+from django.conf.urls import url
 
 import logging
 logger = logging.getLogger('conduit')
@@ -18,24 +37,46 @@ logger = logging.getLogger('conduit')
 from conduit import Conduit
 from conduit.subscribe import subscribe, avoid, match
 from conduit.exceptions import HttpInterrupt
-from conduit.api.utils import get_field_by_name, get_all_field_names
-
-try:
-    from django.contrib.postgres.fields import ArrayField
-except ImportError:
-    class ArrayField(object):
-        pass
+from conduit.api import converters
+from conduit.api import serializers
+from conduit.api.codecs import get_codec
+from conduit.api.utils import (
+    get_field_by_name,
+    get_all_field_names,
+    encode_cursor,
+    decode_cursor,
+    EmptyResultSet,
+    estimate_count,
+    get_queryset_sql,
+    supports_window_functions,
+    can_return_bulk_ids,
+    fetch_in_chunks
+)
+
+
+# Matches the pk part of detail urls, see _get_url_patterns
+PK_PATTERN = re.compile(r'^\w+$')
+# Stands in for the pk when reversing detail uri templates
+PK_PLACEHOLDER = 'conduitpk'
+# Representations of get list objects, see produce_response_data
+LAYOUTS = ('objects', 'columns')
 
 
 class Api(object):
 
-    def __init__(self, name='v1'):
+    def __init__(self, name='v1', codec=None):
         self.name = name
+        # JSON codec of the registered resources, see conduit.api.codecs
+        self.codec = codec
         self._resources = []
         # Reference attached resources by model type
         self._by_model = {}
         # List model names by app models module
         self._app_models = {}
+        # List uris, without script prefix, to resources by urlconf
+        self._uri_prefixes = {}
+        # Reversed uris, without script prefix, by urlconf and view name
+        self._uri_templates = {}
 
     def register(self, resource_instance):
         # Add to list of resources
@@ -49,6 +90,87 @@ class Api(object):
 
         # Attach the api to the resource instance
         resource_instance.Meta.api = self
+        # Resolve the conduit now so bad stages fail at startup
+        resource_instance._get_plan()
+        self._uri_prefixes = {}
+        self._uri_templates = {}
+
+    def _get_uri_template(self, view_name, kwargs=None):
+        key = (get_urlconf(), view_name)
+        try:
+            return self._uri_templates[key]
+        except KeyError:
+            pass
+        script_prefix = get_script_prefix()
+        # Failures aren't cached, reverse raises them again
+        try:
+            uri = reverse(view_name, kwargs=kwargs)
+        except NoReverseMatch:
+            return None
+        if not uri.startswith(script_prefix):
+            return None
+        template = uri[len(script_prefix):]
+        self._uri_templates[key] = template
+        return template
+
+    def get_resource_uri(self, resource, obj=None):
+        """
+        Returns the uri of a resource's list or of obj, or None
+
+        Uris are formatted from a template reversed once per view,
+        None means reverse has to work it out.
+        """
+        list_view_name, detail_view_name = resource._get_view_names()
+        if obj is None:
+            template = self._get_uri_template(list_view_name)
+            if template is None:
+                return None
+            return get_script_prefix() + template
+
+        pk_field = resource.Meta.pk_field
+        pk = six.text_type(getattr(obj, pk_field))
+        if not PK_PATTERN.match(pk):
+            return None
+        template = self._get_uri_template(detail_view_name, {pk_field: PK_PLACEHOLDER})
+        if template is None:
+            return None
+        return get_script_prefix() + template.replace(PK_PLACEHOLDER, pk, 1)
+
+    def _get_uri_prefixes(self):
+        urlconf = get_urlconf()
+        try:
+            return self._uri_prefixes[urlconf]
+        except KeyError:
+            pass
+        script_prefix = get_script_prefix()
+        prefixes = {}
+        for resource in self._resources:
+            try:
+                list_uri = resource._get_resource_uri()
+            except Exception:
+                # Resource isn't mounted
+                continue
+            if list_uri.startswith(script_prefix):
+                prefixes[list_uri[len(script_prefix):]] = resource
+        self._uri_prefixes[urlconf] = prefixes
+        return prefixes
+
+    def decode_uri(self, uri):
+        """
+        Returns (resource, pk) for a detail uri of this api or None
+
+        Looks the list uri up in a table built with one reverse per
+        resource instead of matching the uri against the urlconf
+        """
+        script_prefix = get_script_prefix()
+        path = uri.split('?', 1)[0]
+        if not path.startswith(script_prefix) or not path.endswith('/'):
+            return None
+        (list_path, sep, pk,) = path[len(script_prefix):-1].rpartition('/')
+        resource = self._get_uri_prefixes().get(list_path + sep)
+        if resource is None or not PK_PATTERN.match(pk):
+            return None
+        return resource, pk
 
     @property
     def api_url(self):
@@ -63,6 +185,10 @@ class Api(object):
         return url_patterns
 
 
+# Marks clients which wrote recently for read_after_write_window
+STICKY_WRITE_COOKIE = 'conduit_recent_write'
+
+
 class Resource(Conduit):
     """
     RESTful api resource
@@ -76,10 +202,75 @@ class Resource(Conduit):
         # get list requests
         default_limit = 20
         max_limit = 200
+        # How get list requests are paginated. 'bundles' slices the
+        # bundles after per object authorization, 'queryset' applies
+        # LIMIT / OFFSET in the database before any bundles are built
+        # and 'cursor' walks the ordering with opaque next / prev keys
+        pagination = 'bundles'
+        # How the total of a get list request is counted. 'exact' runs
+        # COUNT(*), 'estimate' asks the PostgreSQL query planner, 'window'
+        # adds COUNT(*) OVER () to the query fetching the objects, 'cached'
+        # reuses an exact count for count_cache_timeout seconds and None
+        # skips counting altogether
+        count_strategy = 'exact'
+        count_cache_timeout = 60
+        # Record the wall time of every conduit stage and send it
+        # back in a Server-Timing header
+        timing = False
+        # With timing on, log a warning with the slowest stages
+        # when a request takes at least this many seconds
+        slow_request_threshold = None
+        # JSON codec name or instance, 'json', 'simplejson', 'ujson',
+        # 'orjson' or 'auto' for the fastest one installed. None uses
+        # the codec of the Api, backends not installed fall back to json
+        codec = None
+        # Formats responses can be written in, by Accept header or
+        # ?format=, see conduit.api.serializers. The first is the
+        # default, others like 'ndjson', 'csv' or 'msgpack' are opt in.
+        # Request bodies are read by their Content-Type.
+        # 'arrow' and 'parquet' export model values without bundles, so
+        # resources overriding auth_get_list need auth_get_list_queryset
+        serializers = ('json',)
+        # Stream get list responses, fetching and dehydrating
+        # stream_chunk_size objects at a time. Keep it below max_limit
+        # or pages are fetched in a single chunk
+        streaming = False
+        stream_chunk_size = 50
 
         # List of allowed methods on a resource for simple
         # authorization limits
         allowed_methods = ['get', 'post', 'put', 'delete']
+        # Methods which run inside a database transaction, reads
+        # skip the BEGIN / COMMIT round trips. None wraps every method
+        atomic_methods = ['post', 'put', 'delete']
+        # Database aliases for get requests and for writes. None
+        # leaves the choice to the DATABASE_ROUTERS
+        read_db = None
+        write_db = None
+        # Seconds after a write during which the same client
+        # reads from write_db, so it sees its own changes
+        read_after_write_window = 0
+        # Insert post list requests with bulk_create, batch_size rows
+        # per query. Skips Model.save and the pre / post save signals,
+        # only used where the database returns the new primary keys
+        bulk_create = False
+        bulk_create_batch_size = 500
+        # How saved objects are read back for the response. 'each'
+        # refetches every object, 'bulk' refetches them all together,
+        # 'auto_fields' only reloads auto_now / auto_now_add fields
+        # and None returns the objects as they were saved
+        refresh_policy = 'each'
+        # Put requests fetch the objects they update this many
+        # primary keys per query
+        lookup_batch_size = 500
+        # Lock the rows a put request updates, in primary key
+        # order so concurrent requests don't deadlock
+        select_for_update = False
+        # How put requests write objects. 'full' saves every column,
+        # 'changed' skips unchanged objects and saves only changed
+        # columns, 'bulk' also groups objects changing the same
+        # columns into one UPDATE, bypassing Model.save and signals
+        update_policy = 'full'
         # Publically accessible filters designated by
         # filter string
         allowed_filters = []
@@ -102,6 +293,12 @@ class Resource(Conduit):
         return resource_name
 
     def _get_resource_uri(self, obj=None, data=None):
+        api = getattr(self.Meta, 'api', None)
+        if api is not None:
+            resource_uri = api.get_resource_uri(self, obj=obj)
+            if resource_uri is not None:
+                return resource_uri
+
         list_view_name, detail_view_name = self._get_view_names()
 
         try:
@@ -164,8 +361,91 @@ class Resource(Conduit):
     def urls(self):
         return self._get_url_patterns()
 
+    def _get_codec(self):
+        codec = getattr(self.Meta, 'codec', None)
+        if codec is None:
+            codec = getattr(getattr(self.Meta, 'api', None), 'codec', None)
+        return get_codec(codec)
+
+    def _get_serializers(self):
+        """
+        Returns the installed serializers enabled by Meta.serializers,
+        JSON if none of them are installed
+        """
+        enabled = []
+        names = getattr(self.Meta, 'serializers', ('json',))
+        for name in names:
+            if name in serializers.serializers:
+                enabled.append(serializers.serializers[name])
+        if not enabled:
+            logger.info('None of the serializers {0} are installed, using json'.format(', '.join(names)))
+            enabled.append(serializers.serializers['json'])
+        return enabled
+
+    def _negotiate_serializer(self, request, pub):
+        """
+        Picks the serializer of the response from ?format= or the Accept
+        header. Answers 406 if none of them can be produced
+        """
+        enabled = self._get_serializers()
+        if not self._can_export_values(pub):
+            enabled = [serializer for serializer in enabled if not serializer.from_queryset]
+            if not enabled:
+                # Errors and write responses of export only resources
+                enabled = [serializers.serializers['json']]
+        format = request.GET.get('format')
+        if format:
+            for serializer in enabled:
+                if serializer.format == format:
+                    return serializer
+            message = {'__all__': '{0} is not an available format'.format(format)}
+            response = self.create_json_response(py_obj=message, status=406)
+            raise HttpInterrupt(response)
+
+        accept = request.META.get('HTTP_ACCEPT')
+        if not accept:
+            return enabled[0]
+        for media_type in serializers.parse_accept(accept):
+            if media_type == '*/*':
+                return enabled[0]
+            for serializer in enabled:
+                if media_type in serializer.media_types:
+                    return serializer
+                if media_type.endswith('/*') and serializer.content_type.startswith(media_type[:-1]):
+                    return serializer
+        message = {'__all__': 'None of {0} can be produced'.format(accept)}
+        response = self.create_json_response(py_obj=message, status=406)
+        raise HttpInterrupt(response)
+
+    def _can_export_values(self, pub):
+        """
+        Whether serializers with from_queryset can answer a request,
+        they only write objects read from the database
+        """
+        return 'get' in pub
+
+    def _get_request_serializer(self, request):
+        """
+        Picks the serializer reading the request body by its Content-Type
+
+        JSON and unknown types are always read as JSON, whatever
+        Meta.serializers lists. Answers 415 for the other formats the
+        resource doesn't offer or can't read
+        """
+        content_type = request.META.get('CONTENT_TYPE', '').split(';')[0].strip().lower()
+        for serializer in six.itervalues(serializers.serializers):
+            if content_type in serializer.media_types:
+                if serializer.format == 'json':
+                    return serializer
+                if serializer.can_load and serializer in self._get_serializers():
+                    return serializer
+                message = {'__all__': '{0} is not a supported request format'.format(content_type)}
+                response = self.create_json_response(py_obj=message, status=415)
+                raise HttpInterrupt(response)
+        return serializers.serializers['json']
+
     def create_json_response(self, py_obj, status=200):
-        content = json.dumps(py_obj)
+        content = self._get_codec().dumps(py_obj)
         response = HttpResponse(content=content, status=status, content_type='application/json')
         return response
 
@@ -184,6 +464,7 @@ class Resource(Conduit):
         else:
             pub.append('list')
         kwargs['pub'] = pub
+        kwargs['serializer'] = self._negotiate_serializer(request, pub)
         return (request, args, kwargs)
 
     def check_allowed_methods(self, request, *args, **kwargs):
@@ -309,6 +590,185 @@ class ModelResource(Resource):
                 matched_fieldnames.append(fieldname)
         return matched_fieldnames
 
+    def _get_related_lookups(self, prefix='', prefetch_only=False, seen=None):
+        """
+        Collect select_related and prefetch_related lookups from explicit fields
+
+        Embedded resources are followed so that their own related fields
+        are loaded in the same pass. Anything below a prefetched relation
+        has to be prefetched as well.
+        """
+        select_related = []
+        prefetch_related = []
+        seen = (seen or frozenset()) | frozenset([self.__class__])
+        for field in self._get_explicit_fields():
+            if getattr(field, 'related', None) not in ('fk', 'm2m'):
+                continue
+            if not getattr(field, 'prefetch', True):
+                continue
+            try:
+                model_field = self.Meta.model._meta.get_field(field.attribute)
+            except FieldDoesNotExist:
+                continue
+
+            lookup = '{0}{1}'.format(prefix, field.attribute)
+            is_fk = isinstance(model_field, models.ForeignKey)
+            if is_fk and not prefetch_only:
+                select_related.append(lookup)
+            else:
+                prefetch_related.append(lookup)
+
+            if field.embed:
+                field.setup_resource()
+                if field.resource_cls in seen:
+                    continue
+                nested_select, nested_prefetch = field.resource_cls()._get_related_lookups(
+                    prefix='{0}__'.format(lookup),
+                    prefetch_only=prefetch_only or not is_fk,
+                    seen=seen
+                )
+                select_related.extend(nested_select)
+                prefetch_related.extend(nested_prefetch)
+        return select_related, prefetch_related
+
+    def _load_related(self, queryset):
+        """
+        Apply select_related / prefetch_related for the resource's Fields
+        """
+        select_related, prefetch_related = self._get_related_lookups()
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def _count_objs(self, queryset, strategy='exact'):
+        """
+        Count the queryset with the given strategy
+
+        Returns the count and the strategy that actually produced it,
+        since strategies fall back to an exact count where unsupported.
+        """
+        if not strategy:
+            return None, None
+
+        if strategy == 'estimate':
+            count = estimate_count(queryset)
+            if count is not None:
+                return count, 'estimate'
+
+        if strategy == 'cached':
+            try:
+                sql, params = get_queryset_sql(queryset)
+            except EmptyResultSet:
+                return 0, 'exact'
+            key = '{0}{1}{2}'.format(queryset.db, sql, params).encode('utf-8')
+            key = 'conduit.count.{0}'.format(hashlib.md5(key).hexdigest())
+            count = cache.get(key)
+            if count is None:
+                count = queryset.count()
+                cache.set(key, count, self.Meta.count_cache_timeout)
+            return count, 'cached'
+
+        return queryset.count(), 'exact'
+
+    def _get_cursor_ordering(self, order_by=None):
+        """
+        Returns the (fieldname, descending) pair used for cursor pagination
+
+        Only concrete fields of the model itself can key a cursor, and
+        not nullable ones since NULL has no position to continue from
+        """
+        pk_name = self.Meta.model._meta.pk.name
+        if not order_by:
+            return pk_name, False
+        descending = order_by.startswith('-')
+        fieldname = order_by.lstrip('-')
+        if fieldname == 'pk':
+            return pk_name, descending
+        try:
+            field = self.Meta.model._meta.get_field(fieldname)
+        except FieldDoesNotExist:
+            field = None
+        if not isinstance(field, models.Field) or isinstance(field, models.ManyToManyField):
+            message = {'__all__': '{0} can not be used with cursor pagination'.format(order_by)}
+            response = self.create_json_response(py_obj=message, status=400)
+            raise HttpInterrupt(response)
+        if field.null:
+            message = {'__all__': '{0} is nullable and can not be used with cursor pagination'.format(order_by)}
+            response = self.create_json_response(py_obj=message, status=400)
+            raise HttpInterrupt(response)
+        return field.name, descending
+
+    def _paginate_by_cursor(self, queryset, cursor=None, order_by=None, limit=None):
+        """
+        Fetch one page of queryset after (or before) the cursor position
+
+        Rows are ordered by the ordering field with the primary key as a
+        tie breaker, so each page is a single indexed range scan no matter
+        how deep into the collection it is.
+        Returns the page of objects and a dict of next / prev cursors.
+        """
+        model = self.Meta.model
+        pk_name = model._meta.pk.name
+        fieldname, descending = self._get_cursor_ordering(order_by)
+        limit = limit or self.Meta.default_limit
+
+        direction, position = 'next', None
+        if cursor:
+            try:
+                direction, value, pk = decode_cursor(cursor)
+            except ValueError:
+                message = {'__all__': '{0} is not a valid cursor'.format(cursor)}
+                response = self.create_json_response(py_obj=message, status=400)
+                raise HttpInterrupt(response)
+            position = (value, pk)
+
+        # Walking backwards flips the ordering, the page is reversed after
+        backwards = direction == 'prev'
+        reverse = descending != backwards
+        sign = '-' if reverse else ''
+        ordering = ['{0}pk'.format(sign)]
+        if fieldname != pk_name:
+            ordering.insert(0, '{0}{1}'.format(sign, fieldname))
+        queryset = queryset.order_by(*ordering)
+
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if reverse else 'gt'
+            if fieldname == pk_name:
+                keyset = Q(**{'pk__{0}'.format(lookup): pk})
+            else:
+                keyset = Q(**{'{0}__{1}'.format(fieldname, lookup): value})
+                keyset |= Q(**{fieldname: value, 'pk__{0}'.format(lookup): pk})
+            queryset = queryset.filter(keyset)
+
+        # Fetch one extra row to find out if another page exists
+        objs = list(queryset[:limit + 1])
+        has_more = len(objs) > limit
+        objs = objs[:limit]
+        if backwards:
+            objs.reverse()
+
+        field = model._meta.get_field(fieldname)
+
+        def make_cursor(cursor_direction, obj):
+            return encode_cursor(cursor_direction, field.value_to_string(obj), six.text_type(obj.pk))
+
+        cursors = {'next': None, 'prev': None}
+        if objs:
+            # has_more always refers to the direction we walked in
+            if backwards:
+                if has_more:
+                    cursors['prev'] = make_cursor('prev', objs[0])
+                cursors['next'] = make_cursor('next', objs[-1])
+            else:
+                if has_more:
+                    cursors['next'] = make_cursor('next', objs[-1])
+                if position is not None:
+                    cursors['prev'] = make_cursor('prev', objs[0])
+        return objs, cursors
+
     def build_pub(self, request, *args, **kwargs):
         """
         Builds a list of keywords relevant to this request
@@ -322,8 +782,42 @@ class ModelResource(Resource):
         else:
             pub.append('list')
         kwargs['pub'] = pub
+        kwargs['serializer'] = self._negotiate_serializer(request, pub)
+        kwargs['using'] = self.get_db_alias(request, pub)
         return (request, args, kwargs)
 
+    def get_db_alias(self, request, pub):
+        """
+        Returns the database alias for the queries of a request
+
+        Reads go to Meta.read_db unless the client wrote within
+        Meta.read_after_write_window seconds, everything else goes
+        to Meta.write_db. None leaves the choice to the routers.
+        """
+        if 'get' in pub and STICKY_WRITE_COOKIE not in request.COOKIES:
+            return self.Meta.read_db
+        return self.Meta.write_db
+
+    def _get_transaction_alias(self, request):
+        """
+        Alias get_db_alias picks for the writes of a request, so the
+        transaction follows an overridden get_db_alias
+        """
+        pub = [request.method.lower()]
+        if 'get' in pub:
+            # Get stages which write do so on the write alias
+            pub = ['post']
+        return self.get_db_alias(request, pub)
+
+    def _get_using(self, request, kwargs):
+        """
+        Database alias chosen by build_pub, related field
+        conduits don't run it so ask get_db_alias directly
+        """
+        if 'using' in kwargs:
+            return kwargs['using']
+        return self.get_db_alias(request, kwargs['pub'])
+
     def check_allowed_methods(self, request, *args, **kwargs):
         allowed_methods = getattr(self.Meta, 'allowed_methods', ['get', 'put', 'post', 'delete'])
         for keyword in kwargs['pub']:
@@ -338,12 +832,18 @@ class ModelResource(Resource):
         """
         Retrieve instance of model referenced by url kwargs
         """
+        # Related fields hand over objects they already fetched
+        if 'objs' in kwargs:
+            return (request, args, kwargs)
         cls = self.Meta.model
+        queryset = cls.objects.using(self._get_using(request, kwargs))
+        if 'get' in kwargs['pub']:
+            queryset = self._load_related(queryset)
         try:
             kwds = {
                 self.Meta.pk_field: kwargs[self.Meta.pk_field]
             }
-            instance = cls.objects.get(**kwds)
+            instance = queryset.get(**kwds)
         except cls.DoesNotExist:
             message = {'__all__': 'Object does not exist'}
             response = self.create_json_response(py_obj=message, status=404)
@@ -365,6 +865,17 @@ class ModelResource(Resource):
         # Remove special filters
         order_by = get_params.get('order_by', self.Meta.default_ordering)
         get_params.pop('order_by', None)
+        # Read by build_pub
+        get_params.pop('format', None)
+
+        layout = get_params.get('layout', None)
+        get_params.pop('layout', None)
+        if layout:
+            if layout not in LAYOUTS:
+                message = {'__all__': '{0} is not a valid layout'.format(layout)}
+                response = self.create_json_response(py_obj=message, status=400)
+                raise HttpInterrupt(response)
+            kwargs['layout'] = layout
         if order_by:
             if (order_by not in self.Meta.allowed_ordering) and (order_by != self.Meta.default_ordering):
                 message = {'__all__': '{0} is not a valid ordering'.format(order_by)}
@@ -385,6 +896,11 @@ class ModelResource(Resource):
         get_params.pop('offset', None)
         kwargs['offset'] = offset
 
+        cursor = get_params.get('cursor', None)
+        get_params.pop('cursor', None)
+        if cursor:
+            kwargs['cursor'] = cursor
+
         # Add default filters
         filters = {}
         filters.update(self.Meta.default_filters)
@@ -410,23 +926,191 @@ class ModelResource(Resource):
         limiting the instances it must iterate through
         """
         cls = self.Meta.model
-        total_instances = cls.objects.all()
+        total_instances = self._load_related(cls.objects.using(self._get_using(request, kwargs)))
         # apply ordering
         if 'order_by' in kwargs:
             total_instances = total_instances.order_by(kwargs['order_by'])
 
         filtered_instances = total_instances.filter(**kwargs['filters'])
+        filtered_instances = self.auth_get_list_queryset(request, filtered_instances, *args, **kwargs)
+
+        count_strategy = self.Meta.count_strategy
+        pagination = self.Meta.pagination
+        if self._is_streaming(kwargs):
+            # Streamed pages are sliced in the database and the window
+            # count would need the whole page in memory
+            if pagination == 'bundles':
+                pagination = 'queryset'
+            if count_strategy == 'window':
+                count_strategy = 'exact'
+        paginate_queryset = pagination == 'queryset' and kwargs.get('limit')
+        if pagination == 'bundles' and kwargs.get('limit'):
+            # The page is sliced from the bundles, prefetch for it alone
+            # in limit_get_list rather than for every filtered object
+            kwargs['prefetch_lookups'] = filtered_instances._prefetch_related_lookups
+            filtered_instances = filtered_instances.prefetch_related(None)
+        if count_strategy == 'window':
+            # A cursor predicate would limit what the window counts
+            if self.Meta.pagination == 'cursor' or not supports_window_functions(connections[filtered_instances.db]):
+                count_strategy = 'exact'
+
+        if count_strategy == 'window' and not paginate_queryset:
+            # Without a page sliced in SQL there is no window to count in,
+            # but every object is fetched anyway, so count them exactly
+            kwargs['total_count'] = len(filtered_instances)
+            count_strategy = 'exact'
+        elif count_strategy != 'window':
+            kwargs['total_count'], count_strategy = self._count_objs(filtered_instances, count_strategy)
+        kwargs['count_strategy'] = count_strategy
+
+        # Only fetch the requested page from the database
+        if paginate_queryset:
+            start = kwargs['offset']
+            end = kwargs['offset'] + kwargs['limit']
+            if 'total_count' in kwargs:
+                filtered_instances = filtered_instances[start:end]
+            else:
+                page = filtered_instances.extra(select={'_conduit_total': 'COUNT(*) OVER ()'})
+                page = list(page[start:end])
+                if page:
+                    kwargs['total_count'] = page[0]._conduit_total
+                elif start:
+                    # Paged past the end, so the window has no row to report on
+                    kwargs['total_count'], kwargs['count_strategy'] = self._count_objs(filtered_instances)
+                else:
+                    kwargs['total_count'] = 0
+                filtered_instances = page
+        elif pagination == 'cursor':
+            filtered_instances, kwargs['cursors'] = self._paginate_by_cursor(
+                filtered_instances,
+                cursor=kwargs.get('cursor'),
+                order_by=kwargs.get('order_by'),
+                limit=kwargs.get('limit')
+            )
+
         kwargs['objs'] = filtered_instances
-        kwargs['total_count'] = filtered_instances.count()
         return (request, args, kwargs)
 
+    def _is_streaming(self, kwargs):
+        pub = kwargs.get('pub', [])
+        if 'get' not in pub or 'list' not in pub:
+            return False
+        if 'serializer' not in kwargs:
+            # Lists embedded by related fields are dehydrated whole,
+            # only the view's own response has a serializer to stream to
+            return False
+        return self.Meta.streaming or self._exports_values(kwargs)
+
+    def _can_export_values(self, pub):
+        """
+        Value exports of lists have no bundles for auth_get_list to
+        check, so resources overriding it only offer them when
+        auth_get_list_queryset is overridden as well
+        """
+        if 'get' not in pub:
+            return False
+        if 'list' not in pub:
+            return True
+        cls = self.__class__
+        checks_bundles = six.get_unbound_function(cls.auth_get_list) is not six.get_unbound_function(ModelResource.auth_get_list)
+        checks_queryset = six.get_unbound_function(cls.auth_get_list_queryset) is not six.get_unbound_function(ModelResource.auth_get_list_queryset)
+        return checks_queryset or not checks_bundles
+
+    def _exports_values(self, kwargs):
+        return getattr(kwargs.get('serializer'), 'from_queryset', False)
+
+    def _get_export_fields(self):
+        """
+        (name, model field) pairs of the concrete fields a values export
+        reads, in plan order. Foreign keys are read as the related pk
+        """
+        model = self.Meta.model
+        concrete_fields = dict([(field.name, field) for field in model._meta.concrete_fields])
+        skipped_fieldnames = set(self._get_explicit_field_by_type('gfk'))
+        fields = []
+        for fieldname in self._get_model_fields():
+            field = concrete_fields.get(fieldname)
+            if field is not None and fieldname not in skipped_fieldnames:
+                fields.append((fieldname, field))
+        return fields
+
+    def _iter_value_chunks(self, objs, fields):
+        """
+        Yields lists of stream_chunk_size value tuples of fields,
+        querysets are read with values_list
+        """
+        chunk_size = self.Meta.stream_chunk_size
+        attnames = [field.attname for (fieldname, field,) in fields]
+        if isinstance(objs, QuerySet):
+            rows = objs.prefetch_related(None).values_list(*attnames)
+            try:
+                rows = rows.iterator(chunk_size=chunk_size)
+            except TypeError:
+                # Django < 2.0 has no chunk_size
+                rows = rows.iterator()
+        else:
+            rows = (tuple([getattr(obj, attname) for attname in attnames]) for obj in objs)
+        rows = iter(rows)
+        chunk = list(islice(rows, chunk_size))
+        while chunk:
+            yield chunk
+            chunk = list(islice(rows, chunk_size))
+
+    def _iter_obj_chunks(self, objs):
+        """
+        Yields lists of stream_chunk_size objects, querysets are iterated
+        without caching and have their prefetches run per chunk
+        """
+        chunk_size = self.Meta.stream_chunk_size
+        lookups = ()
+        if isinstance(objs, QuerySet):
+            # iterator() skips prefetch_related
+            lookups = objs._prefetch_related_lookups
+            try:
+                objs = objs.iterator(chunk_size=chunk_size)
+            except TypeError:
+                # Django < 2.0 has no chunk_size
+                objs = objs.iterator()
+        objs = iter(objs)
+        chunk = list(islice(objs, chunk_size))
+        while chunk:
+            if lookups:
+                prefetch_related_objects(chunk, *lookups)
+            yield chunk
+            chunk = list(islice(objs, chunk_size))
+
+    def _get_stream_stages(self):
+        """
+        The stages each streamed chunk of bundles runs through, those
+        between bundles_from_objs and produce_response_data
+        """
+        stages = tuple(self.Meta.conduit)
+        start = stages.index('bundles_from_objs') + 1
+        if 'produce_response_data' in stages:
+            end = stages.index('produce_response_data')
+        else:
+            end = len(stages) - 1
+        return stages[start:end]
+
     @match(match=['get'])
     def bundles_from_objs(self, request, *args, **kwargs):
         """
         Creates a bundle for each object fetched during GET
+
+        Streamed get lists only bundle the first chunk of objects here,
+        the others go through the conduit in return_response.
         """
+        objs = kwargs['objs']
+        if self._exports_values(kwargs) and 'list' in kwargs['pub']:
+            # The serializer reads the values of objs in return_response
+            kwargs['bundles'] = []
+            return request, args, kwargs
+        if self._is_streaming(kwargs):
+            chunks = self._iter_obj_chunks(objs)
+            objs = next(chunks, [])
+            kwargs['stream_chunks'] = chunks
         bundles = []
-        for obj in kwargs['objs']:
+        for obj in objs:
             bundle = {}
             bundle['obj'] = obj
             bundles.append(bundle)
@@ -436,11 +1120,14 @@ class ModelResource(Resource):
     @subscribe(sub=['post', 'put'])
     def json_to_python(self, request, *args, **kwargs):
         """
-        Creates a Python object from request JSON
+        Creates a Python object from the request body
+
+        The body is read as JSON unless its Content-Type names
+        another of the resource's serializers
         """
         if request.body:
-            data = request.body
-            kwargs['request_data'] = json.loads(data.decode('UTF-8'))
+            serializer = self._get_request_serializer(request)
+            kwargs['request_data'] = serializer.loads(self, request.body)
         return (request, args, kwargs)
 
     def _from_basic_type(self, field, data):
@@ -451,64 +1138,12 @@ class ModelResource(Resource):
             attribute=field.name
         )
 
-        if explicit_field:
-            try:
-                return explicit_field.from_basic_type(data)
-            except AttributeError:
-                pass
-
-        if isinstance(field, models.AutoField):
-            return data
-
-        if isinstance(field, models.BooleanField):
-            return data
-
-        if isinstance(field, models.CharField):
-            return data
-
-        if isinstance(field, models.TextField):
-            return data
+        if explicit_field and hasattr(explicit_field, 'from_basic_type'):
+            return explicit_field.from_basic_type(data)
 
-        if isinstance(field, models.IntegerField):
-            if isinstance(data, int):
-                return data
-            return int(data)
-
-        if isinstance(field, models.FloatField):
-            return float(data)
-
-        if isinstance(field, models.FileField):
-            return data
-
-        if isinstance(field, models.ImageField):
-            return data
-
-        if isinstance(field, models.DateTimeField):
-            if data and isinstance(data, six.string_types):
-                return parser.parse(data)
-            else:
-                return None
-
-        if isinstance(field, models.DateField):
-            if data and isinstance(data, six.string_types):
-                return parser.parse(data)
-            else:
-                return None
-
-        if isinstance(field, models.DecimalField):
-            return Decimal(data)
-
-        if isinstance(field, ArrayField):
-            return data
-
-        if isinstance(field, models.ForeignKey):
-            return data
-
-        if isinstance(field, models.ManyToManyField):
-            return data
-
-        if isinstance(field, GenericForeignKey):
-            return data
+        converter = converters.registry.get_from_basic(field)
+        if converter is not None:
+            return converter(field, data)
 
         logger.warn('Could not find field type match for {0}'.format(field))
         return data
@@ -549,35 +1184,123 @@ class ModelResource(Resource):
         bundles = []
         objs = []
         pk_field = getattr(self.Meta, 'pk_field', 'id')
+        using = self._get_using(request, kwargs)
+        if 'put' in kwargs['pub']:
+            # Fetch all the objects being updated up front
+            existing_objs = self._fetch_existing_objs(kwargs['request_data'], using)
+            used_keys = set()
         for data in kwargs['request_data']:
             data_dict = data.copy()
             if 'put' in kwargs['pub']:
-                # Updating existing object, so fetch it
+                # Updating existing object
                 try:
-                    obj = self.Meta.model.objects.get(**{pk_field: data_dict[pk_field]})
-                except self.Meta.model.DoesNotExist:
-                    message = {'__all__': '{0} with key {1} does not exist'.format(self.Meta.model, data_dict[pk_field])}
-                    response = self.create_json_response(py_obj=message, status=400)
-                    raise HttpInterrupt(response)
+                    key = self._normalize_key(data_dict[pk_field])
+                    obj = existing_objs[key]
                 except KeyError:
-                    message = {'__all__': 'Data set missing id or key'}
+                    if pk_field in data_dict:
+                        message = {'__all__': '{0} with key {1} does not exist'.format(self.Meta.model, data_dict[pk_field])}
+                    else:
+                        message = {'__all__': 'Data set missing id or key'}
                     response = self.create_json_response(py_obj=message, status=400)
                     raise HttpInterrupt(response)
+                # Every bundle gets its own instance, like a separate get would
+                if key in used_keys:
+                    obj = self.Meta.model.objects.using(obj._state.db).get(pk=obj.pk)
+                used_keys.add(key)
             else:
                 obj = self.Meta.model()
             bundle = {}
             bundle['request_data'] = data_dict
             bundle['obj'] = obj
+            if 'put' in kwargs['pub'] and self.Meta.update_policy != 'full':
+                # Remember the loaded values to find changed columns
+                bundle['original_values'] = self._get_field_values(obj)
             bundles.append(bundle)
             objs.append(obj)
         kwargs['bundles'] = bundles
         kwargs['objs'] = objs
         return request, args, kwargs
 
+    def _get_field_values(self, obj):
+        """
+        Returns {attname: value} for the concrete non primary key fields
+        """
+        values = {}
+        for field in obj._meta.concrete_fields:
+            if not field.primary_key:
+                values[field.attname] = getattr(obj, field.attname)
+        return values
+
+    def _get_changed_fields(self, bundle):
+        """
+        Attnames of the fields whose values differ from when the object was loaded
+        """
+        obj = bundle['obj']
+        original_values = bundle['original_values']
+        changed = []
+        for field in obj._meta.concrete_fields:
+            if field.attname not in original_values:
+                continue
+            value = self._normalize_value(field, getattr(obj, field.attname))
+            if value != self._normalize_value(field, original_values[field.attname]):
+                changed.append(field.attname)
+        return changed
+
+    def _normalize_value(self, field, value):
+        """
+        Convert a value to the type the model field stores, so hydrated
+        values compare equal to loaded ones. Naive datetimes are made
+        aware like saving them would
+        """
+        try:
+            value = field.to_python(value)
+        except ValidationError:
+            return value
+        if settings.USE_TZ and isinstance(value, datetime.datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value, timezone.get_default_timezone())
+        return value
+
+    def _normalize_key(self, value):
+        """
+        Convert a pk_field value from request data to the type
+        the model field holds, so it matches fetched objects
+        """
+        field = get_field_by_name(self.Meta.model, self.Meta.pk_field)
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            return value
+
+    def _fetch_existing_objs(self, request_data, using):
+        """
+        Returns {key: obj} for the objects referenced by request data
+        """
+        pk_field = self.Meta.pk_field
+        keys = set()
+        for data in request_data:
+            if pk_field in data:
+                keys.add(self._normalize_key(data[pk_field]))
+        queryset = self.Meta.model.objects.using(using)
+        if self.Meta.select_for_update:
+            queryset = queryset.select_for_update().order_by(pk_field)
+            # Chunks must lock in order too, unconvertible keys
+            # can't match a row and only need to sort consistently
+            keys = sorted(keys, key=lambda key: (type(key).__name__, key))
+        return fetch_in_chunks(queryset, pk_field, keys, self.Meta.lookup_batch_size)
+
     # Authorization hooks
     def auth_global(self, request, *args, **kwargs):
         return (request, args, kwargs)
 
+    def auth_get_list_queryset(self, request, queryset, *args, **kwargs):
+        """
+        Restrict the queryset of a get list request before it is counted
+
+        Unlike auth_get_list, this runs before pagination, so it is the
+        place for ownership filters when Meta.pagination = 'queryset'
+        """
+        return queryset
+
     @match(match=['get', 'detail'])
     def auth_get_detail(self, request, *args, **kwargs):
         return (request, args, kwargs)
@@ -651,9 +1374,15 @@ class ModelResource(Resource):
         """
         Paginate results after authorization filters
         """
+        # The queryset was already limited in apply_filters
+        if self.Meta.pagination != 'bundles' or self._is_streaming(kwargs):
+            return request, args, kwargs
         start = kwargs['offset']
         end = kwargs['offset'] + kwargs['limit']
         kwargs['bundles'] = kwargs['bundles'][start:end]
+        lookups = kwargs.pop('prefetch_lookups', None)
+        if lookups and kwargs['bundles']:
+            prefetch_related_objects([bundle['obj'] for bundle in kwargs['bundles']], *lookups)
         return request, args, kwargs
 
     @subscribe(sub=['post', 'put'])
@@ -666,41 +1395,45 @@ class ModelResource(Resource):
         ForeignKey objects must be created and attached to the parent obj
         before saving the parent object, since the field may not be nullable
         """
+        # Related resource fields save the data of all bundles
+        # together, so new related objects are created in one go
+        explicit_fieldnames = self._get_explicit_field_by_type('fk')
+        for fieldname in explicit_fieldnames:
+            pairs = []
+            for bundle in kwargs['bundles']:
+                # Only updated the related field if data was specified
+                if fieldname in bundle['request_data']:
+                    pairs.append((bundle['obj'], bundle['request_data'][fieldname]))
+            if pairs:
+                conduit_field = self._get_explicit_field_by_attribute(fieldname)
+                self._save_related_many(request, conduit_field, pairs, self._get_using(request, kwargs))
+
         for bundle in kwargs['bundles']:
             obj = bundle['obj']
             request_data = bundle['request_data']
 
             # Get all ForeignKey fields on the Model
-            fk_fieldnames = self._get_type_fieldnames(obj, models.ForeignKey)
-            # Get explicit FK fields which are not Model fields
-            fk_fieldnames.extend(self._get_explicit_field_by_type('fk'))
-            # Make sure names are unique
-            fk_fieldnames = set(fk_fieldnames)
+            fk_fieldnames = set(self._get_type_fieldnames(obj, models.ForeignKey))
 
             for fieldname in fk_fieldnames:
                 # Only updated the related field if data was specified
-                if fieldname in request_data:
-                    related_data = request_data.get(fieldname)
-
-                    # If we are using a related resource field, use it
-                    conduit_field = self._get_explicit_field_by_attribute(fieldname)
-                    if conduit_field:
-                        try:
-                            conduit_field.save_related(request, self, obj, related_data)
-                        except HttpInterrupt as e:
-                            # Raise the error but specify it as occuring within
-                            # the related field
-                            error_dict = {fieldname: json.loads(e.response.content)}
-                            response = self.create_json_response(py_obj=error_dict, status=e.response.status_code)
-                            raise HttpInterrupt(response)
-
-                    # Otherwise we do it simply with primary keys
-                    else:
-                        id_fieldname = '{0}_id'.format(fieldname)
-                        setattr(obj, id_fieldname, related_data)
+                if fieldname in request_data and fieldname not in explicit_fieldnames:
+                    # Without a related resource field we do it simply with primary keys
+                    id_fieldname = '{0}_id'.format(fieldname)
+                    setattr(obj, id_fieldname, request_data.get(fieldname))
 
         return request, args, kwargs
 
+    def _save_related_many(self, request, conduit_field, pairs, using=None):
+        try:
+            conduit_field.save_related_many(request, self, pairs, using=using)
+        except HttpInterrupt as e:
+            # Raise the error but specify it as occuring within
+            # the related field
+            error_dict = {conduit_field.attribute: self._get_codec().loads(e.response.content)}
+            response = self.create_json_response(py_obj=error_dict, status=e.response.status_code)
+            raise HttpInterrupt(response)
+
     @subscribe(sub=['post', 'put'])
     def save_gfk_objs(self, request, *args, **kwargs):
         for bundle in kwargs['bundles']:
@@ -715,13 +1448,71 @@ class ModelResource(Resource):
                     conduit_field = self._get_explicit_field_by_attribute(fieldname)
                     if conduit_field and related_data:
                         try:
-                            conduit_field.save_related(request, self, obj, related_data)
+                            conduit_field.save_related(request, self, obj, related_data, using=self._get_using(request, kwargs))
                         except HttpInterrupt as e:
-                            error_dict = {fieldname: json.loads(e.response.content)}
+                            error_dict = {fieldname: self._get_codec().loads(e.response.content)}
                             response = self.create_json_response(py_obj=error_dict, status=e.response.status_code)
                             raise HttpInterrupt(response)
         return request, args, kwargs
 
+    def _can_bulk_create(self, using):
+        """
+        Whether new objects can be inserted with bulk_create
+        """
+        if not self.Meta.bulk_create:
+            return False
+        model = self.Meta.model
+        # bulk_create can't insert multi-table inherited models
+        if model._meta.parents:
+            return False
+        return can_return_bulk_ids(connections[using or router.db_for_write(model)])
+
+    def _bulk_create_bundles(self, bundles, using):
+        """
+        Insert the objects of bundles in batches and replace them
+        with fresh instances fetched in bulk
+        """
+        model = self.Meta.model
+        batch_size = self.Meta.bulk_create_batch_size
+        objs = [bundle['obj'] for bundle in bundles]
+        model.objects.using(using).bulk_create(objs, batch_size=batch_size)
+        policy = self.Meta.refresh_policy
+        # Refetching one by one would undo the point of bulk inserts
+        if policy == 'each':
+            policy = 'bulk'
+        self._refresh_bundles(bundles, policy)
+
+    def _refresh_bundles(self, bundles, policy):
+        """
+        Refresh saved objects in bulk for the 'bulk' and
+        'auto_fields' refresh policies
+        """
+        if policy not in ('bulk', 'auto_fields') or not bundles:
+            return
+        model = self.Meta.model
+        fields = None
+        if policy == 'auto_fields':
+            fields = [
+                field.attname for field in model._meta.concrete_fields
+                if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+            ]
+            if not fields:
+                return
+        queryset = model._base_manager.using(bundles[0]['obj']._state.db)
+        if fields is not None:
+            queryset = queryset.only(*fields)
+        refreshed = fetch_in_chunks(queryset, 'pk', [bundle['obj'].pk for bundle in bundles], self.Meta.lookup_batch_size)
+        for bundle in bundles:
+            fresh_obj = refreshed.get(bundle['obj'].pk)
+            if fresh_obj is None:
+                # Deleted since it was saved, keep what was written
+                continue
+            if fields is None:
+                bundle['obj'] = fresh_obj
+            else:
+                for attname in fields:
+                    setattr(bundle['obj'], attname, getattr(fresh_obj, attname))
+
     @subscribe(sub=['post', 'put'])
     def update_objs_from_data(self, request, *args, **kwargs):
         """
@@ -730,20 +1521,100 @@ class ModelResource(Resource):
         Obj could be existing model or empty/fresh class instance for new
         models.
         """
+        using = self._get_using(request, kwargs)
+        if 'post' in kwargs['pub'] and self._can_bulk_create(using):
+            for bundle in kwargs['bundles']:
+                self._update_from_dict(bundle['obj'], bundle['request_data'])
+            self._bulk_create_bundles(kwargs['bundles'], using)
+            return request, args, kwargs
+
+        update_policy = self.Meta.update_policy
+        auto_now_fields = [
+            field.attname for field in self.Meta.model._meta.concrete_fields
+            if getattr(field, 'auto_now', False)
+        ]
+        saved_bundles = []
+        grouped_bundles = []
         for bundle in kwargs['bundles']:
             obj = bundle['obj']
             self._update_from_dict(obj, bundle['request_data'])
+            update_fields = None
+            if 'original_values' in bundle:
+                update_fields = self._get_changed_fields(bundle)
+                # Nothing to write, the object is as we loaded it
+                if not update_fields:
+                    continue
+                update_fields.extend(auto_now_fields)
+                if update_policy == 'bulk' and Case is not None:
+                    grouped_bundles.append((bundle, update_fields))
+                    continue
             try:
-                obj.save()
+                obj.save(using=using, update_fields=update_fields)
             except ValidationError as e:
                 logger.info(e)
                 response = self.create_json_response(py_obj={'error': e.message}, status=400)
                 raise HttpInterrupt(response)
-            # Refetch the object so that we can return an accurate
-            # representation of the data that is being persisted
-            bundle['obj'] = self.Meta.model.objects.get(**{self.Meta.pk_field: getattr( obj, self.Meta.pk_field )})
+            saved_bundles.append(bundle)
+            if self.Meta.refresh_policy == 'each':
+                # Refetch the object so that we can return an accurate
+                # representation of the data that is being persisted
+                bundle['obj'] = self.Meta.model.objects.using(obj._state.db).get(**{self.Meta.pk_field: getattr( obj, self.Meta.pk_field )})
+        self._refresh_bundles(saved_bundles, self.Meta.refresh_policy)
+
+        if grouped_bundles:
+            self._bulk_update_bundles(grouped_bundles, using)
+            policy = self.Meta.refresh_policy
+            if policy == 'each':
+                policy = 'bulk'
+            self._refresh_bundles([bundle for (bundle, update_fields,) in grouped_bundles], policy)
         return request, args, kwargs
 
+    def _bulk_update_bundles(self, grouped_bundles, using):
+        """
+        Write (bundle, update_fields) pairs with one UPDATE per set of
+        changed columns and lookup_batch_size objects
+        """
+        model = self.Meta.model
+        fields_by_attname = dict([(field.attname, field) for field in model._meta.concrete_fields])
+        groups = {}
+        for (bundle, update_fields,) in grouped_bundles:
+            groups.setdefault(tuple(sorted(update_fields)), []).append(bundle['obj'])
+
+        batch_size = self.Meta.lookup_batch_size
+        queryset = model._base_manager.using(using)
+        for attnames, objs in six.iteritems(groups):
+            fields = [fields_by_attname[attname] for attname in attnames]
+            for obj in objs:
+                for field in fields:
+                    if getattr(field, 'auto_now', False):
+                        # Sets the timestamp on obj like save() would
+                        field.pre_save(obj, False)
+            for start in range(0, len(objs), batch_size):
+                chunk = objs[start:start + batch_size]
+                updates = {}
+                for field in fields:
+                    whens = [When(pk=obj.pk, then=Value(getattr(obj, field.attname))) for obj in chunk]
+                    updates[field.name] = Case(*whens, output_field=field)
+                queryset.filter(pk__in=[obj.pk for obj in chunk]).update(**updates)
+
+    def _normalize_related_pks(self, model, pks):
+        """
+        Convert primary keys from request data to the type of the
+        related model's pk, dropping duplicates but keeping order
+        """
+        pk_field = model._meta.pk
+        normalized = []
+        seen = set()
+        for pk in pks:
+            try:
+                pk = pk_field.to_python(pk)
+            except ValidationError:
+                pass
+            if pk not in seen:
+                seen.add(pk)
+                normalized.append(pk)
+        return normalized
+
     @subscribe(sub=['post', 'put'])
     def save_m2m_objs(self, request, *args, **kwargs):
         """
@@ -752,43 +1623,45 @@ class ModelResource(Resource):
         If m2m field is embed=True, will update m2m attributes or create new m2m objects
         """
         ## Must be done after persisting parent objects
+        # Related resource fields save the data of all bundles
+        # together, so new related objects are created in one go
+        explicit_fieldnames = self._get_explicit_field_by_type('m2m')
+        for fieldname in explicit_fieldnames:
+            pairs = []
+            for bundle in kwargs['bundles']:
+                # Only update the field if it was specified in request
+                related_data = bundle['request_data'].get(fieldname)
+                if related_data:
+                    pairs.append((bundle['obj'], related_data))
+            if pairs:
+                conduit_field = self._get_explicit_field_by_attribute(fieldname)
+                self._save_related_many(request, conduit_field, pairs, self._get_using(request, kwargs))
+
         for bundle in kwargs['bundles']:
             obj = bundle['obj']
             request_data = bundle['request_data']
 
             # Get all M2M fields on the Model
-            m2m_fieldnames = self._get_type_fieldnames(obj, models.ManyToManyField)
-            # Get explicit m2m fields which are not Model fields
-            m2m_fieldnames.extend(self._get_explicit_field_by_type('m2m'))
-            m2m_fieldnames = set(m2m_fieldnames)
+            m2m_fieldnames = set(self._get_type_fieldnames(obj, models.ManyToManyField))
             for fieldname in m2m_fieldnames:
                 # Only update the field if it was specified in request
-                if fieldname in request_data:
+                if fieldname in request_data and fieldname not in explicit_fieldnames:
                     related_data = request_data.get(fieldname)
 
-                    # If we are using a related resource field, use it
-                    conduit_field = self._get_explicit_field_by_attribute(fieldname)
-                    if conduit_field and related_data:
-                        try:
-                            conduit_field.save_related(request, self, obj, related_data)
-                        except HttpInterrupt as e:
-                            # Raise the error but specify it as occuring within
-                            # the related field
-                            error_dict = {fieldname: json.loads(e.response.content)}
-                            response = self.create_json_response(py_obj=error_dict, status=e.response.status_code)
-                            raise HttpInterrupt(response)
-
-                    # Otherwise we do it simply with primary keys
-                    elif related_data:
+                    # Without a related resource field we do it simply with primary keys
+                    if related_data:
                         related_manager = getattr(obj, fieldname)
+                        related_pks = self._normalize_related_pks(related_manager.model, related_data)
+                        attached_pks = set(related_manager.values_list('pk', flat=True))
                         # Remove any pk's not included in related_data
-                        for attached_pk in related_manager.all().values_list('pk', flat=True):
-                            if attached_pk not in related_data:
-                                related_manager.remove(attached_pk)
+                        stale_pks = attached_pks - set(related_pks)
+                        if stale_pks:
+                            related_manager.remove(*stale_pks)
 
-                        # Add all pk's included in related_data
-                        for related_pk in related_data:
-                            related_manager.add(related_pk)
+                        # Add the pk's which aren't attached yet
+                        new_pks = [pk for pk in related_pks if pk not in attached_pks]
+                        if new_pks:
+                            related_manager.add(*new_pks)
 
         return request, args, kwargs
 
@@ -805,6 +1678,10 @@ class ModelResource(Resource):
             'limit': kwargs['limit'],
             'offset': kwargs['offset'],
         }
+        if 'count_strategy' in kwargs:
+            kwargs['meta']['count_strategy'] = kwargs['count_strategy']
+        if 'cursors' in kwargs:
+            kwargs['meta'].update(kwargs['cursors'])
 
         full_path = request.get_full_path() or None
         if full_path is not None:
@@ -833,7 +1710,7 @@ class ModelResource(Resource):
     def delete_detail(self, request, *args, **kwargs):
         instance = kwargs['objs'][0]
         del kwargs['objs']
-        instance.delete()
+        instance.delete(using=self._get_using(request, kwargs))
         kwargs['response'] = ''
         kwargs['status'] = 204
         return (request, args, kwargs)
@@ -844,13 +1721,13 @@ class ModelResource(Resource):
         Prepare the response data dict for each object in bundles
         """
         bundles = kwargs['bundles']
+        plan = self._get_dehydration_plan(bundles[0]['obj']) if bundles else ()
+
         for bundle in bundles:
             obj = bundle['obj']
             obj_data = {}
-            for fieldname in self._get_model_fields(obj):
-                field = get_field_by_name(obj, fieldname)
-
-                dehydrated_value = self._to_basic_type(obj, field)
+            for fieldname, converter in plan:
+                dehydrated_value = converter(obj)
                 if dehydrated_value is not None:
                     obj_data[fieldname] = dehydrated_value
 
@@ -864,9 +1741,14 @@ class ModelResource(Resource):
         Iterates through field attributes and runs their dehydrate method
         """
         fields = self._get_explicit_fields()
-        for bundle in kwargs['bundles']:
-            for field in fields:
-                field.dehydrate(request, self, bundle)
+        for field in fields:
+            # Fields may dehydrate all bundles at once to batch their queries
+            dehydrate_bundles = getattr(field, 'dehydrate_bundles', None)
+            if dehydrate_bundles:
+                dehydrate_bundles(request, self, kwargs['bundles'])
+            else:
+                for bundle in kwargs['bundles']:
+                    field.dehydrate(request, self, bundle)
         return request, args, kwargs
 
     @avoid(avoid=['delete'])
@@ -879,68 +1761,106 @@ class ModelResource(Resource):
                 bundle['response_data']['resource_uri'] = self._get_resource_uri(obj=bundle['obj'])
         return request, args, kwargs
 
-    def _to_basic_type(self, obj, field):
+    def _get_dehydration_plan(self, obj):
         """
-        Convert complex data types into serializable types
+        Returns (fieldname, converter) pairs used to dehydrate objects
+
+        The plan is built from the first object dehydrated and cached per
+        resource class, model and the value types the codec encodes
+        natively, so per object work is a single loop.
+        """
+        # An overridden _to_basic_type has to be called for every value
+        overridden = six.get_unbound_function(self.__class__._to_basic_type) is not six.get_unbound_function(ModelResource._to_basic_type)
+        key = (self.Meta.model, self._get_codec().native_types)
+        plans = self.__class__.__dict__.get('_dehydration_plans')
+        if plans is None:
+            plans = {}
+            self.__class__._dehydration_plans = plans
+        if not overridden and key in plans:
+            return plans[key]
+
+        # Related resource fields replace these values in
+        # dehydrate_explicit_fields, so don't touch the relation here
+        related_fieldnames = set()
+        for field_type in ('fk', 'm2m', 'gfk'):
+            related_fieldnames.update(self._get_explicit_field_by_type(field_type))
+
+        plan = []
+        for fieldname in self._get_model_fields(obj):
+            if fieldname in related_fieldnames:
+                continue
+            field = get_field_by_name(obj, fieldname)
+            if overridden:
+                converter = partial(self._to_basic_type, field=field)
+            else:
+                converter = self._get_basic_type_converter(field)
+            if converter is not None:
+                plan.append((fieldname, converter))
+        plan = tuple(plan)
+
+        if not overridden:
+            plans[key] = plan
+        return plan
+
+    def _get_basic_type_converter(self, field):
+        """
+        Returns a function that converts the field's value on an object
+        into a serializable type, or None if the field can't be serialized
         """
         explicit_field = self._get_explicit_field_by_attribute(
             attribute=field.name)
 
-        if explicit_field:
-            try:
+        if explicit_field and hasattr(explicit_field, 'to_basic_type'):
+            def converter(obj):
                 return explicit_field.to_basic_type(obj, field)
-            except AttributeError as err:
-                pass
-
-        if isinstance(field, models.AutoField):
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.BooleanField):
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.CharField):
-            return field.value_from_object(obj)
+            return converter
 
-        if isinstance(field, models.TextField):
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.IntegerField):
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.FloatField):
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.FileField):
-            return field.value_to_string(obj)
-
-        if isinstance(field, models.ImageField):
-            return field.value_to_string(obj)
-
-        if isinstance(field, models.DateTimeField):
-            return field.value_to_string(obj)
-
-        if isinstance(field, models.DateField):
-            return field.value_to_string(obj)
-
-        if isinstance(field, models.DecimalField):
-            return field.value_to_string(obj)
-
-        if isinstance(field, models.ForeignKey):
-            return field.value_from_object(obj)
-
-        if isinstance(field, ArrayField):
-            print 'conduit array field'
-            print field.value_from_object(obj)
-            return field.value_from_object(obj)
-
-        if isinstance(field, models.ManyToManyField):
-            return getattr(obj, field.name).values_list('id', flat=True)
+        converter = converters.registry.get_to_basic(field)
+        if converter is converters.value_to_string:
+            # Let the codec write dates itself rather than stringify them
+            native_types = self._get_codec().native_types
+            if native_types:
+                return partial(converters.value_or_string, native_types, field)
+        if converter is not None:
+            return partial(converter, field)
 
         logger.info('Could not find field type match for {0}'.format(field))
         return None
 
+    def _to_basic_type(self, obj, field):
+        """
+        Convert complex data types into serializable types
+        """
+        converter = self._get_basic_type_converter(field)
+        if converter is None:
+            return None
+        return converter(obj)
+
+    def _get_columns(self, bundles):
+        """
+        Column names of the columns layout, the dehydrated model fields
+        in plan order and then any other keys of the response data
+        """
+        if not bundles:
+            return []
+        columns = [fieldname for (fieldname, converter,) in self._get_dehydration_plan(bundles[0]['obj'])]
+        # Values dehydrated to None are left out, so look at every object
+        other_keys = set([field.attribute for field in self._get_explicit_fields()])
+        for bundle in bundles:
+            other_keys.update(bundle['response_data'])
+        other_keys.difference_update(columns)
+        columns.extend(sorted(other_keys))
+        return columns
+
     @avoid(avoid=['delete'])
     def produce_response_data(self, request, *args, **kwargs):
+        """
+        Collects the response data of the bundles
+
+        Get lists wrap the objects with their meta. With ?layout=columns
+        the field names are sent once in columns and every object as a
+        row of values in that order.
+        """
         data_dicts = []
         for bundle in kwargs['bundles']:
             data_dicts.append(bundle['response_data'])
@@ -949,10 +1869,18 @@ class ModelResource(Resource):
             kwargs['response_data'] = data_dicts[0]
 
         if 'get' in kwargs['pub'] and 'list' in kwargs['pub']:
-            kwargs['response_data'] = {
-                'meta': kwargs['meta'],
-                'objects': data_dicts
-            }
+            if kwargs.get('layout') == 'columns':
+                columns = self._get_columns(kwargs['bundles'])
+                kwargs['response_data'] = {
+                    'meta': kwargs['meta'],
+                    'columns': columns,
+                    'rows': serializers.to_rows(columns, data_dicts)
+                }
+            else:
+                kwargs['response_data'] = {
+                    'meta': kwargs['meta'],
+                    'objects': data_dicts
+                }
         elif len(data_dicts) == 1:
             kwargs['response_data'] = data_dicts[0]
         else:
@@ -960,7 +1888,50 @@ class ModelResource(Resource):
 
         return (request, args, kwargs)
 
+    def _iter_stream_chunks(self, request, args, kwargs):
+        """
+        Yields the object dicts of a streamed get list a chunk at a time,
+        running each chunk after the first through the stream stages
+        """
+        stages = self._get_stream_stages()
+        chunk_kwargs = dict(kwargs)
+        for key in ('stream_chunks', 'stage_timings', 'response_data'):
+            chunk_kwargs.pop(key, None)
+
+        yield [bundle['response_data'] for bundle in kwargs['bundles']]
+        for objs in kwargs['stream_chunks']:
+            chunk_kwargs['bundles'] = [{'obj': obj} for obj in objs]
+            (request, args, chunk_kwargs,) = self._run_stages(stages, request, *args, **chunk_kwargs)
+            yield [bundle['response_data'] for bundle in chunk_kwargs['bundles']]
+
     def return_response(self, request, *args, **kwargs):
+        serializer = kwargs.get('serializer') or self._get_serializers()[0]
+        if serializer.from_queryset and 'get' in kwargs['pub']:
+            fields = self._get_export_fields()
+            response = StreamingHttpResponse(
+                serializer.stream_values(self, fields, self._iter_value_chunks(kwargs['objs'], fields), kwargs.get('meta')),
+                status=kwargs['status'],
+                content_type=serializer.content_type
+            )
+            patch_vary_headers(response, ('Accept',))
+            return response
+        if 'stream_chunks' in kwargs:
+            response = StreamingHttpResponse(
+                serializer.stream(self, kwargs['response_data'], self._iter_stream_chunks(request, args, kwargs)),
+                status=kwargs['status'],
+                content_type=serializer.content_type
+            )
+            patch_vary_headers(response, ('Accept',))
+            return response
+
         response_data = kwargs.get('response_data', '')
-        response = self.create_json_response(py_obj=response_data, status=kwargs['status'])
+        if serializer.format == 'json':
+            response = self.create_json_response(py_obj=response_data, status=kwargs['status'])
+        else:
+            content = serializer.dumps(self, response_data, kwargs['pub'])
+            response = HttpResponse(content=content, status=kwargs['status'], content_type=serializer.content_type)
+        patch_vary_headers(response, ('Accept',))
+        window = self.Meta.read_after_write_window
+        if window and 'get' not in kwargs['pub'] and response.status_code < 400:
+            response.set_cookie(STICKY_WRITE_COOKIE, '1', max_age=window)
         return response
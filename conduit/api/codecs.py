@@ -0,0 +1,131 @@
+import datetime
+import json
+import logging
+import six
+
+from decimal import Decimal
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger('conduit')
+
+
+def encode_default(obj):
+    """
+    Encodes the types json can't, the same way value_to_string does
+    """
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return six.text_type(obj)
+    raise TypeError('{0!r} is not JSON serializable'.format(obj))
+
+
+class JSONCodec(object):
+    """
+    Encodes python objects to JSON bytes and decodes them back
+
+    native_types lists the value types the codec writes exactly as
+    value_to_string would, so model values of those types can be
+    handed over as they are instead of being stringified first.
+    """
+    name = 'json'
+    native_types = ()
+
+    def dumps(self, py_obj):
+        content = json.dumps(py_obj, default=encode_default)
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+        return content
+
+    def loads(self, data):
+        if isinstance(data, six.binary_type):
+            data = data.decode('UTF-8')
+        return json.loads(data)
+
+
+class SimpleJSONCodec(JSONCodec):
+    name = 'simplejson'
+
+    def dumps(self, py_obj):
+        # use_decimal would turn Decimals into numbers instead of strings
+        content = simplejson.dumps(py_obj, default=encode_default, use_decimal=False)
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+        return content
+
+    def loads(self, data):
+        return simplejson.loads(data)
+
+
+class UJSONCodec(JSONCodec):
+    name = 'ujson'
+
+    def dumps(self, py_obj):
+        try:
+            content = ujson.dumps(py_obj, escape_forward_slashes=False, default=encode_default)
+        except TypeError:
+            # Older ujson has no default hook
+            return super(UJSONCodec, self).dumps(py_obj)
+        if isinstance(content, six.text_type):
+            content = content.encode('utf-8')
+        return content
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class ORJSONCodec(JSONCodec):
+    name = 'orjson'
+    native_types = (datetime.datetime, datetime.date)
+
+    def dumps(self, py_obj):
+        return orjson.dumps(py_obj, default=encode_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+codecs = {'json': JSONCodec()}
+if simplejson is not None:
+    codecs['simplejson'] = SimpleJSONCodec()
+if ujson is not None:
+    codecs['ujson'] = UJSONCodec()
+if orjson is not None:
+    codecs['orjson'] = ORJSONCodec()
+
+# Fastest first, 'auto' picks the first one installed
+AUTO_ORDER = ('orjson', 'ujson', 'simplejson', 'json')
+
+
+def get_codec(codec=None):
+    """
+    Returns a codec for a name, 'auto' or a codec instance
+
+    Names of backends that aren't installed fall back to the stdlib.
+    """
+    if codec is None:
+        return codecs['json']
+    if not isinstance(codec, six.string_types):
+        return codec
+    if codec == 'auto':
+        for name in AUTO_ORDER:
+            if name in codecs:
+                return codecs[name]
+    if codec not in codecs:
+        logger.info('JSON codec {0} is not installed, using json'.format(codec))
+        return codecs['json']
+    return codecs[codec]
@@ -0,0 +1,181 @@
+import datetime
+import inspect
+import six
+
+from decimal import Decimal
+from dateutil import parser
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.utils.dateparse import parse_date, parse_datetime
+
+try:
+    from django.contrib.postgres.fields import ArrayField
+except ImportError:
+    ArrayField = None
+
+try:
+    from django.contrib.gis.db.models import GeometryField
+except (ImportError, ImproperlyConfigured):
+    GeometryField = None
+
+
+class ConverterRegistry(object):
+    """
+    Maps Django model field classes to conversion functions
+
+    to_basic converters take (field, obj) and return a serializable
+    value, from_basic converters take (field, data) and return a value
+    ready to be set on a model instance.
+
+    Lookups walk the MRO of the field class, so a converter registered
+    for CharField also handles EmailField, and are cached per class.
+    """
+    def __init__(self):
+        self._to_basic = {}
+        self._from_basic = {}
+        self._to_basic_cache = {}
+        self._from_basic_cache = {}
+
+    def register(self, field_cls, to_basic=None, from_basic=None):
+        if to_basic is not None:
+            self._to_basic[field_cls] = to_basic
+        if from_basic is not None:
+            self._from_basic[field_cls] = from_basic
+        # Subclasses may resolve differently now
+        self._to_basic_cache.clear()
+        self._from_basic_cache.clear()
+
+    def _resolve(self, converters, cache, field_cls):
+        try:
+            return cache[field_cls]
+        except KeyError:
+            pass
+        converter = None
+        for cls in inspect.getmro(field_cls):
+            if cls in converters:
+                converter = converters[cls]
+                break
+        cache[field_cls] = converter
+        return converter
+
+    def get_to_basic(self, field):
+        """
+        Returns the to_basic converter for a field instance or None
+        """
+        return self._resolve(self._to_basic, self._to_basic_cache, field.__class__)
+
+    def get_from_basic(self, field):
+        """
+        Returns the from_basic converter for a field instance or None
+        """
+        return self._resolve(self._from_basic, self._from_basic_cache, field.__class__)
+
+
+def value_from_object(field, obj):
+    return field.value_from_object(obj)
+
+
+def value_to_string(field, obj):
+    return field.value_to_string(obj)
+
+
+def value_or_string(native_types, field, obj):
+    """
+    Like value_to_string, but values of native_types are returned as they
+    are for codecs which write them the same way themselves
+    """
+    value = field.value_from_object(obj)
+    if isinstance(value, native_types):
+        return value
+    return field.value_to_string(obj)
+
+
+def related_pks(field, obj):
+    return getattr(obj, field.name).values_list('id', flat=True)
+
+
+def geometry_to_wkt(field, obj):
+    value = field.value_from_object(obj)
+    if value is None:
+        return None
+    return value.wkt
+
+
+def unchanged(field, data):
+    return data
+
+
+def to_int(field, data):
+    if isinstance(data, int):
+        return data
+    return int(data)
+
+
+def to_float(field, data):
+    return float(data)
+
+
+def to_decimal(field, data):
+    return Decimal(data)
+
+
+def to_datetime(field, data):
+    """
+    Parse ISO 8601 strings directly, anything else goes through dateutil
+    """
+    if not data or not isinstance(data, six.string_types):
+        return None
+    try:
+        value = parse_datetime(data)
+    except ValueError:
+        value = None
+    if value is None:
+        value = parser.parse(data)
+    return value
+
+
+def to_date(field, data):
+    """
+    Parse ISO 8601 dates directly, anything else goes through dateutil
+
+    Like dateutil, dates are returned as datetimes at midnight
+    """
+    if not data or not isinstance(data, six.string_types):
+        return None
+    try:
+        value = parse_date(data)
+    except ValueError:
+        value = None
+    if value is None:
+        return parser.parse(data)
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+registry = ConverterRegistry()
+register = registry.register
+
+for field_cls in (
+    models.AutoField,
+    models.BooleanField,
+    models.CharField,
+    models.TextField,
+    models.ForeignKey,
+):
+    register(field_cls, to_basic=value_from_object, from_basic=unchanged)
+
+register(models.IntegerField, to_basic=value_from_object, from_basic=to_int)
+register(models.FloatField, to_basic=value_from_object, from_basic=to_float)
+register(models.FileField, to_basic=value_to_string, from_basic=unchanged)
+register(models.DateTimeField, to_basic=value_to_string, from_basic=to_datetime)
+register(models.DateField, to_basic=value_to_string, from_basic=to_date)
+register(models.DecimalField, to_basic=value_to_string, from_basic=to_decimal)
+register(models.ManyToManyField, to_basic=related_pks, from_basic=unchanged)
+register(GenericForeignKey, from_basic=unchanged)
+
+if ArrayField is not None:
+    register(ArrayField, to_basic=value_from_object, from_basic=unchanged)
+
+if GeometryField is not None:
+    register(GeometryField, to_basic=geometry_to_wkt, from_basic=unchanged)
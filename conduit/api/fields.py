@@ -1,13 +1,8 @@
 import six
-import pprint
 from importlib import import_module
 from django.core.urlresolvers import resolve
-try:
-    from django.apps import apps
-    get_model = apps.get_model
-except ImportError:
-    from django.db.models.loading import get_model
-
+from django.contrib.contenttypes.models import ContentType
+from conduit.api.utils import fetch_in_chunks
 import logging
 logger = logging.getLogger('conduit')
 
@@ -35,27 +30,117 @@ class APIField(object):
         if isinstance(self.resource_cls, six.string_types):
             self.resource_cls = import_class(self.resource_cls)
 
-    def build_obj_and_kwargs(self, rel_obj_data):
+    def dehydrate_bundles(self, request, parent_inst, bundles):
+        """
+        Dehydrates the field for every bundle of the parent resource
+        """
+        for bundle in bundles:
+            self.dehydrate(request, parent_inst, bundle)
+        return bundles
+
+    def save_related_many(self, request, parent_inst, pairs, using=None):
+        """
+        Saves the related data of several parent objects
+
+        pairs is a list of (obj, rel_obj_data) tuples, using the
+        database alias of the parent request
+        """
+        for (obj, rel_obj_data,) in pairs:
+            self.save_related(request, parent_inst, obj, rel_obj_data, using=using)
+
+    def is_new_related_data(self, rel_obj_data):
+        """
+        Whether the data describes a related object to create
+        """
+        return isinstance(rel_obj_data, dict) and self.resource_cls.Meta.pk_field not in rel_obj_data
+
+    def create_related(self, request, parent_inst, rel_obj_datas, using=None):
+        """
+        Creates related objects from a list of data dicts with a
+        single post list run of the save conduit, returns the bundles
+        """
+        self.setup_resource()
+        resource = self.resource_cls()
+        resource.Meta.api = parent_inst.Meta.api
+        kwargs = {
+            'request_data': rel_obj_datas,
+            'pub': ['post', 'list'],
+        }
+        if using is not None:
+            kwargs['using'] = using
+        (request, args, kwargs,) = resource._run_stages(self.save_conduit, request, **kwargs)
+        return kwargs['bundles']
+
+    def resolve_uri(self, uri):
+        """
+        Returns the (args, kwargs) of a resource uri
+
+        Uris of the related resource's Api are decoded directly,
+        anything else goes through Django's resolve
+        """
+        api = getattr(self.resource_cls.Meta, 'api', None)
+        decoded = None
+        if api is not None:
+            decoded = api.decode_uri(uri)
+        if decoded is None:
+            func, args, kwargs = resolve(uri)
+            return list(args), kwargs
+        (resource, pk,) = decoded
+        return [], {resource.Meta.pk_field: pk}
+
+    def fetch_uri_objs(self, parent_inst, uris, using=None):
+        """
+        Returns {uri: obj} for related resource uris, fetching the
+        objects with one query per lookup_batch_size keys
+        """
+        self.setup_resource()
+        resource = self.resource_cls()
+        resource.Meta.api = parent_inst.Meta.api
+        pk_field = resource.Meta.pk_field
+        keys = {}
+        for uri in set(uris):
+            args, kwargs = self.resolve_uri(uri)
+            if pk_field in kwargs:
+                keys[uri] = resource._normalize_key(kwargs[pk_field])
+        queryset = resource.Meta.model.objects.using(using)
+        objs = fetch_in_chunks(queryset, pk_field, set(keys.values()), resource.Meta.lookup_batch_size)
+        uri_objs = {}
+        for (uri, key,) in six.iteritems(keys):
+            if key in objs:
+                uri_objs[uri] = objs[key]
+        return uri_objs
+
+    def build_obj_and_kwargs(self, rel_obj_data, uri_objs=None, using=None):
         ## rel_obj_data is either int, uri string, or dict
         ## If int or uri, we are fetching object and attaching to FK
         ## If dict, we could be creating an FK or updating one in place
+        ## uri_objs holds objects fetched in bulk by fetch_uri_objs
+        ## using is the database alias of the parent request
         pk_field = self.resource_cls.Meta.pk_field
+        manager = self.resource_cls.Meta.model.objects.db_manager(using)
         if isinstance(rel_obj_data, int):
             args = []
             kwargs = {}
             kwargs['pub'] = ['get', 'detail']
             pk = rel_obj_data
-            related_obj = self.resource_cls.Meta.model.objects.get(
+            related_obj = manager.get(
                 **{pk_field: pk}
             )
+            kwargs[pk_field] = pk
+            kwargs['objs'] = [related_obj]
             kwargs['bundles'] = [{'obj': related_obj}]
         elif isinstance(rel_obj_data, six.string_types):
-            func, args, kwargs = resolve(rel_obj_data)
+            if uri_objs and rel_obj_data in uri_objs:
+                related_obj = uri_objs[rel_obj_data]
+                args = []
+                kwargs = {pk_field: getattr(related_obj, pk_field)}
+            else:
+                args, kwargs = self.resolve_uri(rel_obj_data)
+                related_obj = manager.get(
+                    **{pk_field: kwargs[pk_field]}
+                )
             kwargs['pub'] = ['get', 'detail']
-            pk_field = self.resource_cls.Meta.pk_field
-            related_obj = self.resource_cls.Meta.model.objects.get(
-                **{pk_field: kwargs[pk_field]}
-            )
+            kwargs['objs'] = [related_obj]
             kwargs['bundles'] = [{'obj': related_obj}]
         else:
             args = []
@@ -72,6 +157,8 @@ class APIField(object):
                 # Creating a new object
                 kwargs['pub'] = ['post', 'list']
 
+        if using is not None:
+            kwargs['using'] = using
         return args, kwargs
 
 
@@ -111,11 +198,13 @@ class ForeignKeyField(APIField):
         'save_m2m_objs',
     )
 
-    def __init__(self, attribute=None, resource_cls=None, embed=False):
+    def __init__(self, attribute=None, resource_cls=None, embed=False, prefetch=True):
         self.related = 'fk'
         self.attribute = attribute
         self.embed = embed
         self.resource_cls = resource_cls
+        # Load the related objects alongside the parent queryset
+        self.prefetch = prefetch
 
     def dehydrate(self, request, parent_inst, bundle=None):
         """
@@ -133,11 +222,7 @@ class ForeignKeyField(APIField):
             resource.Meta.api = parent_inst.Meta.api
             ## Only run dehydrate if we are embedding the resource
             if self.embed:
-                for methodname in self.dehydrate_conduit:
-                    bound_method = resource._get_method(methodname)
-                    pretty_kwargs = pprint.pformat(kwargs)
-                    logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(resource.__class__.__name__, bound_method.__name__, pretty_kwargs))
-                    (request, args, kwargs,) = bound_method(request, *args, **kwargs)
+                (request, args, kwargs,) = resource._run_stages(self.dehydrate_conduit, request, *args, **kwargs)
                 # Grab the dehydrated data and place it on the parent's bundle
                 related_bundle = kwargs['bundles'][0]
                 field_data = related_bundle['response_data']
@@ -149,7 +234,7 @@ class ForeignKeyField(APIField):
         bundle['response_data'][self.attribute] = field_data
         return bundle
 
-    def save_related(self, request, parent_inst, obj, rel_obj_data):
+    def save_related(self, request, parent_inst, obj, rel_obj_data, uri_objs=None, using=None):
         """
         Save the related object from data provided
         """
@@ -157,15 +242,11 @@ class ForeignKeyField(APIField):
 
         related_obj = None
         if rel_obj_data is not None:
-            args, kwargs = self.build_obj_and_kwargs(rel_obj_data)
+            args, kwargs = self.build_obj_and_kwargs(rel_obj_data, uri_objs, using)
 
             resource = self.resource_cls()
             resource.Meta.api = parent_inst.Meta.api
-            for methodname in self.save_conduit:
-                bound_method = resource._get_method(methodname)
-                pretty_kwargs = pprint.pformat(kwargs)
-                logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(resource.__class__.__name__, bound_method.__name__, pretty_kwargs))
-                (request, args, kwargs,) = bound_method(request, *args, **kwargs)
+            (request, args, kwargs,) = resource._run_stages(self.save_conduit, request, *args, **kwargs)
 
             related_obj = kwargs['bundles'][0]['obj']
 
@@ -174,6 +255,35 @@ class ForeignKeyField(APIField):
 
         return related_obj
 
+    def save_related_many(self, request, parent_inst, pairs, using=None):
+        """
+        Saves the related data of several parent objects
+
+        New related objects are created together, the rest
+        are saved one by one with save_related
+        """
+        self.setup_resource()
+        creates = []
+        if self.embed:
+            creates = [index for (index, pair,) in enumerate(pairs) if self.is_new_related_data(pair[1])]
+        if len(creates) < 2:
+            creates = []
+        else:
+            bundles = self.create_related(request, parent_inst, [pairs[index][1] for index in creates], using)
+            for (index, related_bundle,) in zip(creates, bundles):
+                setattr(pairs[index][0], self.attribute, related_bundle['obj'])
+
+        # Fetch the objects of all related uris together
+        uris = [rel_obj_data for (obj, rel_obj_data,) in pairs if isinstance(rel_obj_data, six.string_types)]
+        uri_objs = None
+        if len(uris) > 1:
+            uri_objs = self.fetch_uri_objs(parent_inst, uris, using)
+
+        creates = set(creates)
+        for (index, (obj, rel_obj_data,),) in enumerate(pairs):
+            if index not in creates:
+                self.save_related(request, parent_inst, obj, rel_obj_data, uri_objs, using)
+
 
 class ManyToManyField(APIField):
     dehydrate_conduit = (
@@ -212,11 +322,13 @@ class ManyToManyField(APIField):
         'save_m2m_objs',
     )
 
-    def __init__(self, attribute=None, resource_cls=None, embed=False):
+    def __init__(self, attribute=None, resource_cls=None, embed=False, prefetch=True):
         self.related = 'm2m'
         self.attribute = attribute
         self.embed = embed
         self.resource_cls = resource_cls
+        # Load the related objects alongside the parent queryset
+        self.prefetch = prefetch
 
     def dehydrate(self, request, parent_inst, bundle=None):
         """
@@ -232,11 +344,7 @@ class ManyToManyField(APIField):
         resource.Meta.api = parent_inst.Meta.api
 
         if self.embed:
-            for methodname in self.dehydrate_conduit:
-                bound_method = resource._get_method(methodname)
-                pretty_kwargs = pprint.pformat(kwargs)
-                logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(resource.__class__.__name__, bound_method.__name__, pretty_kwargs))
-                (request, args, kwargs,) = bound_method(request, *args, **kwargs)
+            (request, args, kwargs,) = resource._run_stages(self.dehydrate_conduit, request, *args, **kwargs)
 
             dehydrated_data = []
             for related_bundle in kwargs['bundles']:
@@ -249,9 +357,13 @@ class ManyToManyField(APIField):
         bundle['response_data'][self.attribute] = dehydrated_data
         return bundle
 
-    def save_related(self, request, parent_inst, obj, rel_obj_data):
+    def save_related(self, request, parent_inst, obj, rel_obj_data, created_bundles=None, uri_objs=None, using=None):
         """
         Save the related object from data provided
+
+        created_bundles maps id() of new object data dicts to the
+        bundles save_related_many already created them in, uri_objs
+        holds objects fetched in bulk by fetch_uri_objs
         """
         self.setup_resource()
         # For ManyToMany, rel_obj_data should be formatted
@@ -259,9 +371,17 @@ class ManyToManyField(APIField):
         related_bundles = []
         pk_field = self.resource_cls.Meta.pk_field
         for obj_data in rel_obj_data:
+            if created_bundles and id(obj_data) in created_bundles:
+                related_bundles.append(created_bundles[id(obj_data)])
+                continue
             # Expecting a resource_uri, so grab the pk, etc.
-            if not self.embed or isinstance(rel_obj_data, six.string_types):
-                func, args, kwargs = resolve(obj_data)
+            if not self.embed or isinstance(obj_data, six.string_types):
+                if uri_objs and obj_data in uri_objs:
+                    related_obj = uri_objs[obj_data]
+                    args = []
+                    kwargs = {pk_field: getattr(related_obj, pk_field), 'objs': [related_obj]}
+                else:
+                    args, kwargs = self.resolve_uri(obj_data)
                 kwargs['pub'] = ['get', 'detail']
 
             else:
@@ -278,11 +398,11 @@ class ManyToManyField(APIField):
                     # Creating a new object
                     kwargs['pub'] = ['post', 'list']
 
+            if using is not None:
+                kwargs['using'] = using
             resource = self.resource_cls()
             resource.Meta.api = parent_inst.Meta.api
-            for methodname in self.save_conduit:
-                bound_method = resource._get_method(methodname)
-                (request, args, kwargs) = bound_method(request, *args, **kwargs)
+            (request, args, kwargs,) = resource._run_stages(self.save_conduit, request, *args, **kwargs)
             # Grab the dehydrated data and place it on the parent's bundle
             related_bundles.append(kwargs['bundles'][0])
 
@@ -297,26 +417,62 @@ class ManyToManyField(APIField):
         # The parent object must be persisted before
         # we can use related managers
         if not getattr(obj, pk_field, None):
-            obj.save()
+            obj.save(using=using)
         related_manager = getattr(obj, self.attribute)
-        for attached_obj in related_manager.all():
-            if attached_obj not in related_objs:
-                # Django m2m fields we can remove
-                if hasattr(related_manager, 'remove'):
-                    related_manager.remove(attached_obj)
-                # Only way to remove a reverse ForeignKey
-                # is to delete the object!
-                else:
-                    attached_obj.delete()
-
+        related_pks = set([related_obj.pk for related_obj in related_objs])
+        attached_objs = list(related_manager.all())
+        attached_pks = set([attached_obj.pk for attached_obj in attached_objs])
+        stale_objs = [attached_obj for attached_obj in attached_objs if attached_obj.pk not in related_pks]
+        if stale_objs:
+            # Django m2m fields we can remove
+            if hasattr(related_manager, 'remove'):
+                related_manager.remove(*stale_objs)
+            # Only way to remove a reverse ForeignKey
+            # is to delete the object!
+            else:
+                for stale_obj in stale_objs:
+                    stale_obj.delete()
 
-        # Now add any related objects that we created
-        # Adding an existing relationship has no effect
-        for related_obj in related_objs:
-            related_manager.add(related_obj)
+        # Now add any related objects that aren't attached yet
+        new_objs = [related_obj for related_obj in related_objs if related_obj.pk not in attached_pks]
+        if new_objs:
+            related_manager.add(*new_objs)
 
         return related_objs
 
+    def save_related_many(self, request, parent_inst, pairs, using=None):
+        """
+        Saves the related data of several parent objects
+
+        New embedded objects of every parent are created together
+        before each parent's relations are synced
+        """
+        self.setup_resource()
+        created_bundles = {}
+        if self.embed:
+            new_datas = []
+            for (obj, rel_obj_data,) in pairs:
+                for obj_data in rel_obj_data:
+                    if self.is_new_related_data(obj_data):
+                        new_datas.append(obj_data)
+            if len(new_datas) > 1:
+                bundles = self.create_related(request, parent_inst, new_datas, using)
+                for (obj_data, related_bundle,) in zip(new_datas, bundles):
+                    created_bundles[id(obj_data)] = related_bundle
+
+        # Fetch the objects of all related uris together
+        uris = []
+        for (obj, rel_obj_data,) in pairs:
+            for obj_data in rel_obj_data:
+                if isinstance(obj_data, six.string_types):
+                    uris.append(obj_data)
+        uri_objs = None
+        if len(uris) > 1:
+            uri_objs = self.fetch_uri_objs(parent_inst, uris, using)
+
+        for (obj, rel_obj_data,) in pairs:
+            self.save_related(request, parent_inst, obj, rel_obj_data, created_bundles, uri_objs, using)
+
 
 class GenericForeignKeyField(APIField):
     dehydrate_conduit = (
@@ -355,12 +511,14 @@ class GenericForeignKeyField(APIField):
         'save_m2m_objs',
     )
 
-    def __init__(self, attribute=None, resource_map=None, embed=False):
+    def __init__(self, attribute=None, resource_map=None, embed=False, prefetch=True):
         self.related = 'gfk'
         self.attribute = attribute
         self.embed = embed
         self.resource_cls = None
         self.resource_map = resource_map or {}
+        # Load the related objects of all bundles in bulk
+        self.prefetch = prefetch
 
     def get_gfk_field_by_attr(self, model_or_obj, attribute):
         """
@@ -371,15 +529,23 @@ class GenericForeignKeyField(APIField):
                 return virtual_field
         raise Exception('GenericForeignKey "{0}" not found on "{1}"'.format(attribute, model_or_obj))
 
+    def get_content_type_id(self, obj, gfk_field):
+        """
+        Read the content type id of the GFK without fetching the content type
+        """
+        ct_field = obj._meta.get_field(gfk_field.ct_field)
+        return getattr(obj, ct_field.attname)
+
     def setup_resource(self, obj=None, api=None):
         """
         Resource must be set every request since GFK points to different models
         """
         # Get the model field that represents the GFK
         gfk_field = self.get_gfk_field_by_attr(obj, self.attribute)
-        content_type = getattr(obj, gfk_field.ct_field)
-        if content_type:
-            model = get_model(content_type.app_label, content_type.name)
+        content_type_id = self.get_content_type_id(obj, gfk_field)
+        if content_type_id:
+            # ContentType caches lookups by id for the whole process
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
 
             self.resource_cls = self.fetch_resource(model, api=api)
 
@@ -422,11 +588,7 @@ class GenericForeignKeyField(APIField):
             if self.embed:
                 args = []
                 kwargs = {'objs': [obj], 'pub': ['detail', 'get']}
-                for methodname in self.dehydrate_conduit:
-                    bound_method = resource._get_method(methodname)
-                    pretty_kwargs = pprint.pformat(kwargs)
-                    logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(resource.__class__.__name__, bound_method.__name__, pretty_kwargs))
-                    (request, args, kwargs,) = bound_method(request, *args, **kwargs)
+                (request, args, kwargs,) = resource._run_stages(self.dehydrate_conduit, request, *args, **kwargs)
                 # Grab the dehydrated data and place it on the parent's bundle
                 related_bundle = kwargs['bundles'][0]
                 field_data = related_bundle['response_data']
@@ -437,18 +599,80 @@ class GenericForeignKeyField(APIField):
         bundle['response_data'][self.attribute] = field_data
         return bundle
 
-    def save_related(self, request, parent_inst, obj, rel_obj_data):
+    def dehydrate_bundles(self, request, parent_inst, bundles):
+        """
+        Dehydrates the GFK of all bundles with one query per content type
+
+        Related objects of the same content type are fetched together and,
+        if embedded, run through their resource's dehydrate conduit as
+        details.
+        """
+        if not self.prefetch:
+            return super(GenericForeignKeyField, self).dehydrate_bundles(request, parent_inst, bundles)
+
+        api = parent_inst.Meta.api
+        # Group the target object ids by content type without fetching them
+        targets_by_ctype = {}
+        for bundle in bundles:
+            obj = bundle['obj']
+            bundle['response_data'][self.attribute] = None
+            gfk_field = self.get_gfk_field_by_attr(obj, self.attribute)
+            content_type_id = self.get_content_type_id(obj, gfk_field)
+            object_id = getattr(obj, gfk_field.fk_field)
+            if content_type_id is None or object_id is None:
+                continue
+            targets = targets_by_ctype.setdefault(content_type_id, [])
+            targets.append((bundle, object_id))
+
+        for content_type_id, targets in six.iteritems(targets_by_ctype):
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+            resource_cls = self.fetch_resource(model, api=api)
+            if isinstance(resource_cls, six.string_types):
+                resource_cls = import_class(resource_cls)
+
+            resource = resource_cls()
+            resource.Meta.api = api
+
+            pk_field = model._meta.pk
+            object_ids = [pk_field.to_python(object_id) for bundle, object_id in targets]
+            using = targets[0][0]['obj']._state.db
+            queryset = model._base_manager.using(using)
+            if self.embed and hasattr(resource, '_load_related'):
+                queryset = resource._load_related(queryset.all())
+            related_objs = queryset.in_bulk(object_ids)
+            if self.embed:
+                # Only the fetch is batched, each object is still
+                # authorized as a detail like dehydrate does
+                dehydrated_data = {}
+                for (pk, related_obj,) in six.iteritems(related_objs):
+                    args = []
+                    kwargs = {'objs': [related_obj], 'pub': ['detail', 'get']}
+                    (request, args, kwargs,) = resource._run_stages(self.dehydrate_conduit, request, *args, **kwargs)
+                    dehydrated_data[pk] = kwargs['bundles'][0]['response_data']
+
+            for (bundle, object_id), pk in zip(targets, object_ids):
+                related_obj = related_objs.get(pk)
+                if related_obj is None:
+                    continue
+                if self.embed:
+                    field_data = dehydrated_data.get(pk)
+                else:
+                    field_data = resource._get_resource_uri(obj=related_obj)
+                bundle['response_data'][self.attribute] = field_data
+        return bundles
+
+    def save_related(self, request, parent_inst, obj, rel_obj_data, using=None):
         self.setup_resource(obj=obj, api=parent_inst.Meta.api)
         related_obj = None
         if rel_obj_data is not None:
             resource = self.resource_cls()
             resource.Meta.api = parent_inst.Meta.api
 
-            args, kwargs = self.build_obj_and_kwargs(rel_obj_data)
+            args, kwargs = self.build_obj_and_kwargs(rel_obj_data, using=using)
 
-            for methodname in self.save_conduit:
-                bound_method = resource._get_method(methodname)
-                (request, args, kwargs,) = bound_method(request, *args, **kwargs)
+            (request, args, kwargs,) = resource._run_stages(self.save_conduit, request, *args, **kwargs)
 
             # Now we have to update the FK reference on the original object
             # before saving
@@ -0,0 +1,437 @@
+import csv
+import inspect
+import six
+
+from django.conf import settings
+from django.db import models
+
+from conduit.api.codecs import encode_default
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Parquet support is optional in pyarrow builds
+try:
+    import pyarrow.parquet as parquet
+except ImportError:
+    parquet = None
+
+
+def to_rows(columns, data_dicts):
+    """
+    Turns object dicts into lists of values in columns order
+    """
+    return [[data.get(column) for column in columns] for data in data_dicts]
+
+
+def get_rows(response_data, pub):
+    """
+    Returns the list of object dicts in response data
+    """
+    if response_data == '' or response_data is None:
+        return []
+    if 'get' in pub and 'list' in pub:
+        if 'columns' in response_data:
+            columns = response_data['columns']
+            return [dict(zip(columns, row)) for row in response_data['rows']]
+        return response_data['objects']
+    if isinstance(response_data, list):
+        return response_data
+    return [response_data]
+
+
+def parse_accept(accept):
+    """
+    Returns the media types of an Accept header, most preferred first
+    """
+    media_types = []
+    for (index, part,) in enumerate(accept.split(',')):
+        pieces = part.split(';')
+        media_type = pieces[0].strip().lower()
+        if not media_type:
+            continue
+        quality = 1.0
+        for param in pieces[1:]:
+            (name, _, value,) = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            # Equal qualities keep the order of the header
+            media_types.append((-quality, index, media_type))
+    media_types.sort()
+    return [media_type for (quality, index, media_type,) in media_types]
+
+
+class Serializer(object):
+    """
+    Writes response data in one format and reads request bodies
+
+    format is the name used in ?format= and Meta.serializers,
+    media_types the Accept / Content-Type values it answers to.
+    Serializers which can't read request bodies set can_load to False.
+    Serializers with from_queryset write get requests straight from
+    the model values of the objects with stream_values, skipping the
+    dehydrate stages.
+    """
+    format = None
+    media_types = ()
+    can_load = True
+    from_queryset = False
+
+    @property
+    def content_type(self):
+        return self.media_types[0]
+
+    def dumps(self, resource, response_data, pub):
+        """
+        Returns the bytes of response_data, the python objects of a
+        response to a request with pub
+        """
+        raise NotImplementedError('{0} serializer has no dumps'.format(self.format))
+
+    def loads(self, resource, data):
+        """
+        Returns the python objects of the request body bytes in data,
+        only called when can_load is True
+        """
+        raise NotImplementedError('{0} serializer has no loads'.format(self.format))
+
+    def stream(self, resource, response_data, chunks):
+        """
+        Yields the content of a get list response in fragments
+
+        chunks yields lists of object dicts, starting with the objects
+        already in response_data. Formats which can't be written in
+        pieces collect the objects and write them at once.
+        """
+        response_data = dict(response_data)
+        objects = []
+        for chunk in chunks:
+            objects.extend(chunk)
+        if 'columns' in response_data:
+            response_data['rows'] = to_rows(response_data['columns'], objects)
+        else:
+            response_data['objects'] = objects
+        yield self.dumps(resource, response_data, ['get', 'list'])
+
+
+class JSONSerializer(Serializer):
+    format = 'json'
+    media_types = ('application/json', 'text/json')
+
+    def dumps(self, resource, response_data, pub):
+        return resource._get_codec().dumps(response_data)
+
+    def loads(self, resource, data):
+        return resource._get_codec().loads(data)
+
+    def stream(self, resource, response_data, chunks):
+        codec = resource._get_codec()
+        columns = response_data.get('columns')
+        list_key = 'objects' if columns is None else 'rows'
+        # Envelope first, objects are appended as they are dehydrated
+        envelope = []
+        for (key, value,) in six.iteritems(response_data):
+            if key != list_key:
+                envelope.append(codec.dumps(key) + b': ' + codec.dumps(value))
+        envelope.append(codec.dumps(list_key) + b': [')
+        yield b'{' + b', '.join(envelope)
+
+        separator = b''
+        for chunk in chunks:
+            if columns is not None:
+                chunk = to_rows(columns, chunk)
+            if chunk:
+                yield separator + b', '.join([codec.dumps(data) for data in chunk])
+                separator = b', '
+        yield b']}'
+
+
+class NDJSONSerializer(Serializer):
+    """
+    One JSON object per line, list meta is left out
+    """
+    format = 'ndjson'
+    media_types = ('application/x-ndjson', 'application/jsonlines')
+
+    def dumps(self, resource, response_data, pub):
+        return b''.join(self._dump_lines(resource, get_rows(response_data, pub)))
+
+    def _dump_lines(self, resource, rows):
+        codec = resource._get_codec()
+        return [codec.dumps(data) + b'\n' for data in rows]
+
+    def loads(self, resource, data):
+        codec = resource._get_codec()
+        objects = [codec.loads(line) for line in data.splitlines() if line.strip()]
+        if len(objects) == 1:
+            return objects[0]
+        return objects
+
+    def stream(self, resource, response_data, chunks):
+        for chunk in chunks:
+            if chunk:
+                yield b''.join(self._dump_lines(resource, chunk))
+
+
+class CSVSerializer(Serializer):
+    """
+    A header row and one row per object, for flat resources
+
+    Columns come from the columns layout or the first object, nested
+    values are written as JSON. Request bodies can't be CSV.
+    """
+    format = 'csv'
+    media_types = ('text/csv',)
+    can_load = False
+
+    @property
+    def content_type(self):
+        return 'text/csv; charset=utf-8'
+
+    def dumps(self, resource, response_data, pub):
+        rows = get_rows(response_data, pub)
+        columns = None
+        if 'get' in pub and 'list' in pub:
+            columns = response_data.get('columns')
+        if columns is None:
+            if not rows:
+                return b''
+            columns = list(rows[0].keys())
+        return self._dump_rows(resource, rows, columns, header=True)
+
+    def stream(self, resource, response_data, chunks):
+        columns = response_data.get('columns')
+        if columns is not None:
+            yield self._dump_rows(resource, [], columns, header=True)
+        for chunk in chunks:
+            if not chunk:
+                continue
+            if columns is None:
+                columns = list(chunk[0].keys())
+                yield self._dump_rows(resource, chunk, columns, header=True)
+            else:
+                yield self._dump_rows(resource, chunk, columns)
+
+    def _to_cell(self, resource, value):
+        if value is None:
+            return ''
+        if isinstance(value, (dict, list, tuple)):
+            return resource._get_codec().dumps(value).decode('utf-8')
+        if isinstance(value, six.text_type):
+            return value
+        try:
+            return encode_default(value)
+        except TypeError:
+            return six.text_type(value)
+
+    def _dump_rows(self, resource, rows, columns, header=False):
+        # The csv module writes bytes on python 2 and text on python 3
+        output = six.BytesIO() if six.PY2 else six.StringIO()
+        writer = csv.writer(output)
+        lines = []
+        if header:
+            lines.append(columns)
+        for data in rows:
+            lines.append([self._to_cell(resource, data.get(column)) for column in columns])
+        for line in lines:
+            if six.PY2:
+                line = [six.text_type(cell).encode('utf-8') for cell in line]
+            writer.writerow(line)
+        content = output.getvalue()
+        if not six.PY2:
+            content = content.encode('utf-8')
+        return content
+
+
+class MessagePackSerializer(Serializer):
+    format = 'msgpack'
+    media_types = ('application/x-msgpack', 'application/msgpack')
+
+    def dumps(self, resource, response_data, pub):
+        return msgpack.packb(response_data, default=encode_default, use_bin_type=True)
+
+    def loads(self, resource, data):
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except TypeError:
+            # msgpack < 0.5.2 has no raw
+            return msgpack.unpackb(data, encoding='utf-8')
+
+
+class ChunkSink(object):
+    """
+    Write only file collecting what pyarrow writes until it is taken
+    """
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def readable(self):
+        return False
+
+    def seekable(self):
+        return False
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _int64(field):
+    return pyarrow.int64()
+
+
+def _timestamp(field):
+    return pyarrow.timestamp('us', tz='UTC' if settings.USE_TZ else None)
+
+
+ARROW_TYPES = {
+    models.AutoField: _int64,
+    models.IntegerField: _int64,
+    models.BooleanField: lambda field: pyarrow.bool_(),
+    models.NullBooleanField: lambda field: pyarrow.bool_(),
+    models.FloatField: lambda field: pyarrow.float64(),
+    models.DecimalField: lambda field: pyarrow.decimal128(field.max_digits, field.decimal_places),
+    models.DateTimeField: _timestamp,
+    models.DateField: lambda field: pyarrow.date32(),
+    models.TimeField: lambda field: pyarrow.time64('us'),
+}
+
+
+def get_arrow_type(field):
+    """
+    Returns the pyarrow type of a model field's values, foreign keys
+    take the type of the related field and unknown fields are strings
+    """
+    if isinstance(field, models.ForeignKey):
+        # Django 1.9 added target_field
+        target_field = getattr(field, 'target_field', None)
+        if target_field is None:
+            target_field = field.rel.get_related_field()
+        return get_arrow_type(target_field)
+    for cls in inspect.getmro(field.__class__):
+        if cls in ARROW_TYPES:
+            return ARROW_TYPES[cls](field)
+    return pyarrow.string()
+
+
+class ArrowSerializer(Serializer):
+    """
+    Apache Arrow IPC stream of typed columns, one per model field
+
+    Foreign keys hold the related pk and many to many fields are left
+    out. Every chunk of values becomes a record batch, list meta is in
+    the schema metadata as JSON. Output only.
+    """
+    format = 'arrow'
+    media_types = ('application/vnd.apache.arrow.stream',)
+    can_load = False
+    from_queryset = True
+
+    def get_schema(self, resource, fields, meta=None):
+        metadata = None
+        if meta is not None:
+            metadata = {b'conduit.meta': resource._get_codec().dumps(meta)}
+        return pyarrow.schema(
+            [pyarrow.field(name, get_arrow_type(field)) for (name, field,) in fields],
+            metadata=metadata
+        )
+
+    def get_record_batch(self, schema, rows):
+        arrays = []
+        for (arrow_field, values,) in zip(schema, zip(*rows)):
+            if arrow_field.type == pyarrow.string():
+                values = [None if value is None else six.text_type(value) for value in values]
+            arrays.append(pyarrow.array(list(values), type=arrow_field.type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def open_writer(self, sink, schema):
+        return pyarrow.RecordBatchStreamWriter(sink, schema)
+
+    def write_batch(self, writer, batch):
+        writer.write_batch(batch)
+
+    def stream_values(self, resource, fields, value_chunks, meta=None):
+        """
+        Yields the output a record batch at a time
+
+        fields are (name, model field) pairs, value_chunks yields lists
+        of value tuples in the same order.
+        """
+        schema = self.get_schema(resource, fields, meta)
+        sink = ChunkSink()
+        writer = self.open_writer(pyarrow.PythonFile(sink, mode='w'), schema)
+        for rows in value_chunks:
+            self.write_batch(writer, self.get_record_batch(schema, rows))
+            data = sink.take()
+            if data:
+                yield data
+        writer.close()
+        yield sink.take()
+
+
+class ParquetSerializer(ArrowSerializer):
+    """
+    Parquet file with a row group per chunk of values
+    """
+    format = 'parquet'
+    media_types = ('application/vnd.apache.parquet', 'application/x-parquet')
+
+    def open_writer(self, sink, schema):
+        return parquet.ParquetWriter(sink, schema)
+
+    def write_batch(self, writer, batch):
+        writer.write_table(pyarrow.Table.from_batches([batch]))
+
+
+serializers = {}
+
+
+def register(serializer):
+    """
+    Makes a serializer available to Meta.serializers by its format
+    """
+    serializers[serializer.format] = serializer
+
+
+register(JSONSerializer())
+register(NDJSONSerializer())
+register(CSVSerializer())
+if msgpack is not None:
+    register(MessagePackSerializer())
+if pyarrow is not None:
+    register(ArrowSerializer())
+if parquet is not None:
+    register(ParquetSerializer())
@@ -1,3 +1,14 @@
+import base64
+import json
+
+from django.db import connections
+# Django 1.11 moved EmptyResultSet to django.core.exceptions
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
+
+
 
 
 def get_field_by_name(obj, field_name):
@@ -47,3 +58,98 @@ def get_apps(*args):
             selected_apps.append(app)
 
     return selected_apps
+
+
+def encode_cursor(direction, value, pk):
+    """
+    Pack a keyset pagination position into an opaque, url safe token
+    """
+    data = json.dumps([direction, value, pk]).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Unpack a token made by encode_cursor
+
+    Raises ValueError if the token was tampered with or is malformed
+    """
+    try:
+        cursor = str(cursor)
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, value, pk = json.loads(data.decode('utf-8'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor: {0}'.format(cursor))
+    if direction not in ('next', 'prev'):
+        raise ValueError('Invalid cursor: {0}'.format(cursor))
+    return direction, value, pk
+
+
+def supports_window_functions(connection):
+    """
+    Whether the database behind connection can run COUNT(*) OVER ()
+    """
+    if connection.vendor in ('postgresql', 'oracle'):
+        return True
+    if connection.vendor == 'sqlite':
+        import sqlite3
+        return sqlite3.sqlite_version_info >= (3, 25, 0)
+    return False
+
+
+def get_queryset_sql(queryset):
+    """
+    Returns the (sql, params) pair the queryset would execute
+    """
+    compiler = queryset.query.get_compiler(using=queryset.db)
+    return compiler.as_sql()
+
+
+def estimate_count(queryset):
+    """
+    Ask the query planner how many rows the queryset will return
+
+    Only supported on PostgreSQL, returns None everywhere else
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = get_queryset_sql(queryset)
+    except EmptyResultSet:
+        return 0
+    cursor = connection.cursor()
+    try:
+        cursor.execute('EXPLAIN (FORMAT JSON) {0}'.format(sql), params)
+        plan = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    # Older psycopg2 versions hand back the json as a string
+    if isinstance(plan, (bytes, type(u''))):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def can_return_bulk_ids(connection):
+    """
+    Whether bulk_create sets primary keys on the created objects
+
+    Django 1.10 added the feature flag, earlier versions never do
+    """
+    return getattr(connection.features, 'can_return_ids_from_bulk_insert', False)
+
+
+def fetch_in_chunks(queryset, field_name, values, chunk_size=500):
+    """
+    Returns a dict of {value: obj} for objects with field_name in values
+
+    Values are queried chunk_size at a time to stay below the
+    query parameter limits of backends like SQLite
+    """
+    values = list(values)
+    objs = {}
+    for start in range(0, len(values), chunk_size):
+        chunk = values[start:start + chunk_size]
+        for obj in queryset.filter(**{'{0}__in'.format(field_name): chunk}):
+            objs[getattr(obj, field_name)] = obj
+    return objs
@@ -1,6 +1,10 @@
 import pprint
+from contextlib import contextmanager
+from timeit import default_timer
 from importlib import import_module
 from conduit.exceptions import HttpInterrupt
+from conduit.subscribe import specialize
+from django.http.response import HttpResponseBase
 
 # Django 1.7 deprecates `commit_on_success` in favor of `atomic`
 try:
@@ -9,6 +13,11 @@ except ImportError:
     from django.db.transaction import commit_on_success as transaction_method
 
 
+@contextmanager
+def no_transaction():
+    yield
+
+
 import logging
 logger = logging.getLogger('conduit')
 
@@ -17,46 +26,170 @@ class Conduit(object):
     """
     Runs a request through a conduit and returns a response
     """
-    def _get_method(self, method_string):
-        method = getattr(self.__class__, method_string, None)
-        cls = self.__class__
+    @classmethod
+    def _resolve_method(cls, method_string):
+        """
+        Returns the plain function for a stage of the conduit
+
+        Stages are method names on the class or dotted paths
+        to a method on another class.
+        """
+        method = getattr(cls, method_string, None)
         if not method:
             pieces = method_string.split('.')
             if len(pieces) < 2:
                 raise Exception('No such method found: {0}'.format(method_string))
             module = '.'.join(pieces[:-2])
-            (cls, method,) = (pieces[-2], pieces[-1])
+            (cls_name, method,) = (pieces[-2], pieces[-1])
             module = import_module(module)
-            cls = getattr(module, cls)
-            method = getattr(cls, method)
-        bound_method = method.__get__( self, cls )
-        return bound_method
+            method = getattr(getattr(module, cls_name), method)
+        # Unbound methods on python 2 check the type of self
+        return getattr(method, '__func__', method)
+
+    @classmethod
+    def _get_plan(cls, stages=None):
+        """
+        Resolves a conduit into a tuple of functions, once per class
+        """
+        if stages is None:
+            stages = cls.Meta.conduit
+        stages = tuple(stages)
+        # Look in this class's own dict, plans are not inherited
+        plans = cls.__dict__.get('_conduit_plans')
+        if plans is None:
+            plans = {}
+            cls._conduit_plans = plans
+        try:
+            return plans[stages]
+        except KeyError:
+            pass
+        plan = tuple([cls._resolve_method(method_string) for method_string in stages])
+        plans[stages] = plan
+        return plan
+
+    def _get_method(self, method_string):
+        method = self._resolve_method(method_string)
+        return method.__get__(self, self.__class__)
+
+    def _run_stages(self, stages, request, *args, **kwargs):
+        """
+        Runs a sequence of conduit stages, returns (request, args, kwargs)
+        """
+        return self._run_plan(self._get_plan(stages), request, *args, **kwargs)
+
+    @classmethod
+    def _get_specialized_plan(cls, plan, start, pub):
+        """
+        Returns plan[start:] reduced to the stages that run for pub
+        """
+        key = (plan, start, frozenset(pub))
+        plans = cls.__dict__.get('_specialized_plans')
+        if plans is None:
+            plans = {}
+            cls._specialized_plans = plans
+        try:
+            return plans[key]
+        except KeyError:
+            pass
+        specialized = specialize(plan[start:], pub)
+        plans[key] = specialized
+        return specialized
+
+    def _run_plan(self, plan, request, *args, **kwargs):
+        # Run stages until the pub is known, the remaining stages
+        # only need to include the ones subscribed to it
+        index = 0
+        while 'pub' not in kwargs and index < len(plan):
+            (request, args, kwargs,) = self._run_method(plan[index], request, *args, **kwargs)
+            index += 1
+        if index < len(plan):
+            for method in self._get_specialized_plan(plan, index, kwargs['pub']):
+                (request, args, kwargs,) = self._run_method(method, request, *args, **kwargs)
+        return request, args, kwargs
+
+    def _run_method(self, method, request, *args, **kwargs):
+        if logger.isEnabledFor(logging.DEBUG):
+            pretty_kwargs = pprint.pformat(kwargs)
+            logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(self.__class__.__name__, method.__name__, pretty_kwargs))
+        timings = kwargs.get('stage_timings')
+        if timings is None:
+            return method(self, request, *args, **kwargs)
+        start = default_timer()
+        try:
+            return method(self, request, *args, **kwargs)
+        finally:
+            timings.append((method.__name__, default_timer() - start))
 
     def view(self, request, *args, **kwargs):
         """
         Process the request as a Django view, return a response
         """
+        plan = self._get_plan()
+        timings = None
+        if getattr(self.Meta, 'timing', False):
+            # Stages append (name, seconds) to the list
+            timings = []
+            kwargs['stage_timings'] = timings
         try:
             # Wrap the request in a transaction
             # If we see an exception (such as HttpInterrupt)
             # all model changes will be rolled back
-            with transaction_method():
-                for method_string in self.Meta.conduit[:-1]:
-                    bound_method = self._get_method(method_string)
-                    pretty_kwargs = pprint.pformat(kwargs)
-                    logger.debug('\n[ {0}.{1} ]: kwargs = \n{2}'.format(self.__class__.__name__, bound_method.__name__, pretty_kwargs))
-                    (request, args, kwargs,) = bound_method( request, *args, **kwargs)
+            with self._get_transaction(request):
+                (request, args, kwargs,) = self._run_plan(plan[:-1], request, *args, **kwargs)
         except HttpInterrupt as e:
-            return e.response
+            response = e.response
+        else:
+            response = self._run_method(plan[-1], request, *args, **kwargs)
+
+        if timings is not None:
+            self._report_timings(request, response, timings)
+        return response
+
+    def _get_transaction(self, request):
+        """
+        Returns the transaction to run the conduit in
+
+        Meta.atomic_methods lists the lowercase http methods which
+        need one, when it is missing every request is atomic. The
+        transaction is opened on the alias of _get_transaction_alias.
+        """
+        atomic_methods = getattr(self.Meta, 'atomic_methods', None)
+        if atomic_methods is None or request.method.lower() in atomic_methods:
+            return transaction_method(using=self._get_transaction_alias(request))
+        return no_transaction()
+
+    def _get_transaction_alias(self, request):
+        """
+        Database alias the request writes to, Meta.write_db if set
+        """
+        return getattr(self.Meta, 'write_db', None)
+
+    def _report_timings(self, request, response, timings):
+        """
+        Adds a Server-Timing header and logs slow requests
+        """
+        total = sum([duration for (name, duration,) in timings])
+        if isinstance(response, HttpResponseBase):
+            metrics = ['{0};dur={1:.2f}'.format(name, duration * 1000) for (name, duration,) in timings]
+            metrics.append('total;dur={0:.2f}'.format(total * 1000))
+            response['Server-Timing'] = ', '.join(metrics)
 
-        bound_response_method = self._get_method(self.Meta.conduit[-1])
-        return bound_response_method(request, *args, **kwargs)
+        threshold = getattr(self.Meta, 'slow_request_threshold', None)
+        if threshold is not None and total >= threshold:
+            slowest = sorted(timings, key=lambda timing: timing[1], reverse=True)[:5]
+            breakdown = ', '.join(['{0}={1:.1f}ms'.format(name, duration * 1000) for (name, duration,) in slowest])
+            logger.warning('Slow request {0} {1} took {2:.1f}ms in {3}: {4}'.format(
+                request.method,
+                request.get_full_path(),
+                total * 1000,
+                self.__class__.__name__,
+                breakdown,
+            ))
 
     def run(self, *args, **kwargs):
         """
         Process conduit as a generic pipeline
         """
-        for method_string in self.Meta.conduit:
-            bound_method = self._get_method(method_string)
-            (args, kwargs,) = bound_method(*args, **kwargs)
+        for method in self._get_plan():
+            (args, kwargs,) = method(self, *args, **kwargs)
         return args, kwargs
@@ -1,38 +1,64 @@
 from functools import wraps
 
 
-def subscribe(sub=None):
+def pub_matches(kind, words, pub):
     """
-    Runs the wrapped method if sub matches any pub namespaces
+    Returns whether a method decorated with `kind` runs for `pub`
+    """
+    if kind == 'subscribe':
+        for name in words:
+            if name in pub:
+                return True
+        return False
+    if kind == 'avoid':
+        for name in words:
+            if name in pub:
+                return False
+        return True
+    if kind == 'match':
+        for name in words:
+            if name not in pub:
+                return False
+        return True
+    raise ValueError('Unknown pub filter: {0}'.format(kind))
 
-    ie: "if any"
+
+def pub_filter(kind, words):
+    """
+    Builds a decorator which only runs the method when pub_matches
+
+    The wrapper keeps (kind, words, func, wrapper) as `pub_rule` so
+    conduits can drop or unwrap it once the pub is known.
     """
+    words = tuple(words)
+
     def func_wrapper(func):
         @wraps(func)
         def returned_wrapper(self, request, *args, **kwargs):
-            for name in sub:
-                if name in kwargs['pub']:
-                    return func(self, request, *args, **kwargs)
+            if pub_matches(kind, words, kwargs['pub']):
+                return func(self, request, *args, **kwargs)
             return request, args, kwargs
+        returned_wrapper.pub_rule = (kind, words, func, returned_wrapper)
         return returned_wrapper
     return func_wrapper
 
 
+def subscribe(sub=None):
+    """
+    Runs the wrapped method if sub matches any pub namespaces
+
+    ie: "if any"
+    """
+    return pub_filter('subscribe', sub)
+
+
 def avoid(avoid=None):
     """
     Avoids running the method if any avoid string matches a pub
 
     ie: "if none of these"
     """
-    def func_wrapper(func):
-        @wraps(func)
-        def returned_wrapper(self, request, *args, **kwargs):
-            for name in avoid:
-                if name in kwargs['pub']:
-                    return request, args, kwargs
-            return func(self, request, *args, **kwargs)
-        return returned_wrapper
-    return func_wrapper
+    return pub_filter('avoid', avoid)
 
 
 def match(match=None):
@@ -41,12 +67,35 @@ def match(match=None):
 
     ie: "if and only if all of these"
     """
-    def func_wrapper(func):
-        @wraps(func)
-        def returned_wrapper(self, request, *args, **kwargs):
-            for name in match:
-                if name not in kwargs['pub']:
-                    return request, args, kwargs
-            return func(self, request, *args, **kwargs)
-        return returned_wrapper
-    return func_wrapper
\ No newline at end of file
+    return pub_filter('match', match)
+
+
+def specialize(plan, pub):
+    """
+    Returns the functions of a conduit plan which run for pub
+
+    Pub filtered methods that don't apply are dropped and the
+    ones that do are replaced by the function they wrap.
+    """
+    specialized = []
+    for method in plan:
+        rule = _get_pub_rule(method)
+        while rule is not None:
+            (kind, words, func, wrapper,) = rule
+            if not pub_matches(kind, words, pub):
+                method = None
+                break
+            method = func
+            rule = _get_pub_rule(method)
+        if method is not None:
+            specialized.append(method)
+    return tuple(specialized)
+
+
+def _get_pub_rule(method):
+    rule = getattr(method, 'pub_rule', None)
+    # Other decorators using functools.wraps copy the attribute,
+    # those wrappers have to run as they are
+    if rule is not None and rule[3] is method:
+        return rule
+    return None
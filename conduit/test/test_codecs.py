@@ -0,0 +1,53 @@
+import datetime
+from decimal import Decimal
+from unittest import skipIf
+
+from conduit.api import codecs
+from conduit.api.codecs import JSONCodec, get_codec
+from conduit.test.testcases import ConduitTestCase
+
+
+class CodecTestCase(ConduitTestCase):
+
+    def test_json_codec(self):
+        codec = get_codec()
+        self.assertIsInstance(codec, JSONCodec)
+        content = codec.dumps({'name': u'caf\xe9', 'decimal': Decimal('1.10')})
+        self.assertIsInstance(content, bytes)
+        self.assertEqual(codec.loads(content), {'name': u'caf\xe9', 'decimal': '1.10'})
+
+    def test_encode_default(self):
+        created = datetime.datetime(2014, 1, 2, 3, 4, 5, 6)
+        data = get_codec().loads(get_codec().dumps([created, created.date()]))
+        self.assertEqual(data, ['2014-01-02T03:04:05.000006', '2014-01-02'])
+        with self.assertRaises(TypeError):
+            get_codec().dumps(object())
+
+    def test_get_codec(self):
+        codec = JSONCodec()
+        self.assertIs(get_codec(codec), codec)
+        self.assertIs(get_codec('json'), codecs.codecs['json'])
+        # Missing backends fall back to the stdlib
+        self.assertIs(get_codec('notinstalled'), codecs.codecs['json'])
+        self.assertIn(get_codec('auto').name, codecs.codecs)
+
+    def test_installed_codecs_match_json(self):
+        py_obj = {
+            'name': u'caf\xe9 / bar',
+            'created': datetime.datetime(2014, 1, 2, 3, 4, 5),
+            'birthday': datetime.date(2014, 1, 2),
+            'decimal': Decimal('1.10'),
+            'items': [1, 2.5, None, True],
+        }
+        expected = get_codec('json').loads(get_codec('json').dumps(py_obj))
+        for name, codec in codecs.codecs.items():
+            content = codec.dumps(py_obj)
+            self.assertIsInstance(content, bytes)
+            self.assertEqual(codec.loads(content), expected, name)
+            self.assertEqual(get_codec('json').loads(content), expected, name)
+
+    @skipIf(codecs.orjson is None, 'orjson is not installed')
+    def test_orjson_native_dates(self):
+        codec = get_codec('orjson')
+        created = datetime.datetime(2014, 1, 2, 3, 4, 5, 6)
+        self.assertEqual(codec.loads(codec.dumps([created])), [created.isoformat()])
@@ -0,0 +1,50 @@
+import datetime
+from decimal import Decimal
+
+from django.db import models
+from django.utils import timezone
+
+from conduit.api import converters
+from conduit.api.converters import ConverterRegistry
+from conduit.test.testcases import ConduitTestCase
+from example.models import CustomField, Foo
+
+
+class ConverterTestCase(ConduitTestCase):
+
+    def test_mro_lookup(self):
+        email_field = models.EmailField()
+        self.assertIs(converters.registry.get_from_basic(email_field), converters.unchanged)
+        positive_field = models.PositiveIntegerField()
+        self.assertIs(converters.registry.get_from_basic(positive_field), converters.to_int)
+        self.assertIs(converters.registry.get_to_basic(CustomField()), None)
+
+    def test_register_custom_field(self):
+        registry = ConverterRegistry()
+        registry.register(models.Field, to_basic=converters.value_from_object)
+        custom_field = CustomField()
+        self.assertIs(registry.get_to_basic(custom_field), converters.value_from_object)
+
+        def custom_to_basic(field, obj):
+            return 'custom'
+        # Registering invalidates the cached lookup
+        registry.register(CustomField, to_basic=custom_to_basic)
+        self.assertIs(registry.get_to_basic(custom_field), custom_to_basic)
+
+    def test_to_datetime(self):
+        field = Foo._meta.get_field('created')
+        value = converters.to_datetime(field, '2013-06-21T01:44:57.367956+00:00')
+        self.assertEqual(value, datetime.datetime(2013, 6, 21, 1, 44, 57, 367956, tzinfo=timezone.utc))
+        # Non ISO 8601 strings fall back to dateutil
+        value = converters.to_datetime(field, 'June 21 2013 1:44am')
+        self.assertEqual(value, datetime.datetime(2013, 6, 21, 1, 44))
+        self.assertEqual(converters.to_datetime(field, ''), None)
+
+    def test_to_date(self):
+        field = Foo._meta.get_field('birthday')
+        self.assertEqual(converters.to_date(field, '2013-06-19'), datetime.datetime(2013, 6, 19))
+        self.assertEqual(converters.to_date(field, 'June 19 2013'), datetime.datetime(2013, 6, 19))
+
+    def test_to_decimal(self):
+        field = Foo._meta.get_field('decimal')
+        self.assertEqual(converters.to_decimal(field, '110.12'), Decimal('110.12'))
@@ -92,3 +92,21 @@ class ResourceFormatTestCase(ConduitTestCase):
         get_detail = self.factory.get('/{0}/{0}/'.format(bar.__class__.__name__,bar.id))
         response = self.resource_as_context.view( get_detail, *[], **{} )
         self.assertEqual(response['success'], True)
+
+    def test_conduit_plan(self):
+        resource_cls = self.resource_as_mixin.__class__
+        plan = resource_cls._get_plan()
+        self.assertEqual(len(plan), 2)
+        self.assertIs(plan[0], ConduitBaseMixin.__dict__['build_pub'])
+        # Resolved once per class
+        self.assertIs(resource_cls._get_plan(), plan)
+
+    def test_conduit_plan_bad_stage(self):
+        class BadResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                conduit = (
+                    'conduit.test.conduit_formats.ConduitBaseMixin.missing_stage',
+                )
+                model = Bar
+        api = Api(name='v1')
+        self.assertRaises(AttributeError, api.register, BadResource())
@@ -3,7 +3,12 @@ import dateutil
 from decimal import Decimal
 from django import forms
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from conduit.api import ModelResource, Api
+from conduit.api.base import STICKY_WRITE_COOKIE
+from conduit.api.utils import can_return_bulk_ids
 from conduit.api.fields import ForeignKeyField, ManyToManyField
 from conduit.exceptions import HttpInterrupt
 from example.models import Bar, Foo, Baz
@@ -412,3 +417,521 @@ class MethodTestCase(ConduitTestCase):
 
         data = kwargs['bundles'][0]['response_data']
         self.assertEqual(data['resource_uri'], '/api/{0}/bar/{1}/'.format(self.resource.Meta.api.name, bar.pk))
+
+    def test_apply_filters_queryset_pagination(self):
+        self.resource.Meta.pagination = 'queryset'
+        for name in ['delta', 'epsilon', 'eta', 'gamma', 'theta']:
+            Bar.objects.create(name=name)
+        kwargs = {
+            'pub': ['get', 'list'],
+            'filters': self.resource.Meta.default_filters,
+            'order_by': 'name',
+            'limit': 2,
+            'offset': 1,
+        }
+        get_list = self.factory.get('/bar/')
+        request, args, kwargs = self.resource.apply_filters(get_list, [], **kwargs)
+        self.assertEqual(kwargs['total_count'], 5)
+        self.assertEqual([bar.name for bar in kwargs['objs']], ['epsilon', 'eta'])
+
+        # Bundles are already paginated, limit_get_list must not slice again
+        request, args, kwargs = self.resource.bundles_from_objs(request, *args, **kwargs)
+        request, args, kwargs = self.resource.limit_get_list(request, *args, **kwargs)
+        self.assertEqual(len(kwargs['bundles']), 2)
+
+    def test_auth_get_list_queryset(self):
+        class OwnedResource(self.resource.__class__):
+            def auth_get_list_queryset(self, request, queryset, *args, **kwargs):
+                return queryset.exclude(name='delta')
+        resource = OwnedResource()
+        for name in ['delta', 'epsilon']:
+            Bar.objects.create(name=name)
+        kwargs = {
+            'pub': ['get', 'list'],
+            'filters': {},
+            'limit': 20,
+            'offset': 0,
+        }
+        get_list = self.factory.get('/bar/')
+        request, args, kwargs = resource.apply_filters(get_list, [], **kwargs)
+        self.assertEqual(kwargs['total_count'], 1)
+        self.assertEqual([bar.name for bar in kwargs['objs']], ['epsilon'])
+
+    def test_apply_filters_cursor_pagination(self):
+        self.resource.Meta.pagination = 'cursor'
+        for name in ['delta', 'epsilon', 'eta', 'gamma', 'theta']:
+            Bar.objects.create(name=name)
+
+        def fetch_page(cursor=None):
+            kwargs = {
+                'pub': ['get', 'list'],
+                'filters': self.resource.Meta.default_filters,
+                'order_by': 'name',
+                'limit': 2,
+                'offset': 0,
+            }
+            if cursor:
+                kwargs['cursor'] = cursor
+            get_list = self.factory.get('/bar/')
+            request, args, kwargs = self.resource.apply_filters(get_list, [], **kwargs)
+            return [bar.name for bar in kwargs['objs']], kwargs['cursors']
+
+        names, cursors = fetch_page()
+        self.assertEqual(names, ['delta', 'epsilon'])
+        self.assertEqual(cursors['prev'], None)
+
+        names, cursors = fetch_page(cursors['next'])
+        self.assertEqual(names, ['eta', 'gamma'])
+
+        last_names, last_cursors = fetch_page(cursors['next'])
+        self.assertEqual(last_names, ['theta'])
+        self.assertEqual(last_cursors['next'], None)
+
+        names, cursors = fetch_page(last_cursors['prev'])
+        self.assertEqual(names, ['eta', 'gamma'])
+
+        names, cursors = fetch_page(cursors['prev'])
+        self.assertEqual(names, ['delta', 'epsilon'])
+        self.assertEqual(cursors['prev'], None)
+
+    def test_invalid_cursor(self):
+        self.resource.Meta.pagination = 'cursor'
+        kwargs = {
+            'pub': ['get', 'list'],
+            'filters': {},
+            'cursor': 'not a cursor',
+            'limit': 2,
+            'offset': 0,
+        }
+        get_list = self.factory.get('/bar/')
+        self.assertRaises(HttpInterrupt, self.resource.apply_filters, get_list, [], **kwargs)
+
+    def test_cursor_nullable_ordering(self):
+        class FooResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                model = Foo
+                pagination = 'cursor'
+                allowed_ordering = ['bar', 'name']
+        foos = self._create_foos(2)
+        foos[0].bar = None
+        foos[0].save()
+        resource = FooResource()
+        kwargs = {
+            'pub': ['get', 'list'],
+            'filters': {},
+            'order_by': 'bar',
+            'limit': 1,
+            'offset': 0,
+        }
+        get_list = self.factory.get('/foo/')
+        # NULL values can't be encoded in a cursor
+        with self.assertRaises(HttpInterrupt) as context:
+            resource.apply_filters(get_list, [], **kwargs)
+        self.assertEqual(context.exception.response.status_code, 400)
+        kwargs['order_by'] = 'name'
+        request, args, kwargs = resource.apply_filters(get_list, [], **kwargs)
+        self.assertEqual(kwargs['objs'], [foos[0]])
+
+    def test_apply_filters_count_strategies(self):
+        for name in ['delta', 'epsilon', 'eta']:
+            Bar.objects.create(name=name)
+        get_list = self.factory.get('/bar/')
+
+        def apply_filters(count_strategy, pagination='bundles', offset=0):
+            self.resource.Meta.count_strategy = count_strategy
+            self.resource.Meta.pagination = pagination
+            kwargs = {
+                'pub': ['get', 'list'],
+                'filters': self.resource.Meta.default_filters,
+                'limit': 2,
+                'offset': offset,
+            }
+            request, args, kwargs = self.resource.apply_filters(get_list, [], **kwargs)
+            return kwargs
+
+        kwargs = apply_filters('exact')
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'exact'))
+
+        kwargs = apply_filters(None)
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (None, None))
+
+        # Planner estimates are PostgreSQL only
+        kwargs = apply_filters('estimate')
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'exact'))
+
+        with self.assertNumQueries(1):
+            kwargs = apply_filters('window', pagination='queryset')
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'window'))
+        self.assertEqual(len(kwargs['objs']), 2)
+
+        kwargs = apply_filters('window', pagination='queryset', offset=10)
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'exact'))
+
+        # Bundles pagination fetches every object and counts them
+        with self.assertNumQueries(1):
+            kwargs = apply_filters('window')
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'exact'))
+        self.assertEqual(len(kwargs['objs']), 3)
+
+        kwargs = apply_filters('cached')
+        self.assertEqual((kwargs['total_count'], kwargs['count_strategy']), (3, 'cached'))
+        Bar.objects.create(name='gamma')
+        with self.assertNumQueries(0):
+            kwargs = apply_filters('cached')
+        self.assertEqual(kwargs['total_count'], 3)
+
+    def test_response_data_from_bundles_plan(self):
+        bar = Bar.objects.create(name='new bar')
+        kwargs = {
+            'pub': ['get', 'detail'],
+            'bundles': [{'obj': bar}]
+        }
+        get_detail = self.factory.get('/bar/1/')
+        request, args, kwargs = self.resource.response_data_from_bundles(get_detail, [], **kwargs)
+        self.assertEqual(kwargs['bundles'][0]['response_data'], {'id': bar.id, 'name': 'new bar'})
+
+        # The plan is built once per resource class and model
+        plan = self.resource._get_dehydration_plan(bar)
+        self.assertIs(plan, self.resource._get_dehydration_plan(Bar.objects.create(name='other bar')))
+
+    def test_response_data_from_bundles_to_basic_type_override(self):
+        class UpperResource(self.resource.__class__):
+            def _to_basic_type(self, obj, field):
+                value = super(UpperResource, self)._to_basic_type(obj, field)
+                if field.name == 'name':
+                    return value.upper()
+                return value
+        bar = Bar.objects.create(name='new bar')
+        kwargs = {
+            'pub': ['get', 'detail'],
+            'bundles': [{'obj': bar}]
+        }
+        get_detail = self.factory.get('/bar/1/')
+        request, args, kwargs = UpperResource().response_data_from_bundles(get_detail, [], **kwargs)
+        self.assertEqual(kwargs['bundles'][0]['response_data']['name'], 'NEW BAR')
+
+    def test_atomic_methods(self):
+        get_list = self.factory.get('/bar/')
+        put_detail = self.factory.put('/bar/1/', {})
+        self.assertNotIsInstance(self.resource._get_transaction(get_list), transaction.Atomic)
+        self.assertIsInstance(self.resource._get_transaction(put_detail), transaction.Atomic)
+
+        class AtomicResource(self.resource.__class__):
+            class Meta(self.resource.Meta):
+                atomic_methods = None
+        self.assertIsInstance(AtomicResource()._get_transaction(get_list), transaction.Atomic)
+
+    def test_transaction_alias(self):
+        self.resource.Meta.read_db = 'replica'
+        put_detail = self.factory.put('/bar/1/', {})
+        self.assertEqual(self.resource._get_transaction(put_detail).using, None)
+
+        # The transaction is opened where get_db_alias sends writes
+        class RoutedResource(self.resource.__class__):
+            def get_db_alias(self, request, pub):
+                if 'get' in pub:
+                    return 'replica'
+                return 'default'
+        resource = RoutedResource()
+        resource.Meta.atomic_methods = None
+        self.assertEqual(resource._get_transaction(put_detail).using, 'default')
+        get_list = self.factory.get('/bar/')
+        self.assertEqual(resource._get_transaction(get_list).using, 'default')
+
+    def test_db_alias(self):
+        self.resource.Meta.read_db = 'replica'
+        self.resource.Meta.write_db = 'default'
+        self.resource.Meta.read_after_write_window = 5
+        get_list = self.factory.get('/bar/')
+        request, args, kwargs = self.resource.build_pub(get_list)
+        self.assertEqual(kwargs['using'], 'replica')
+        post_list = self.factory.post('/bar/', {})
+        request, args, kwargs = self.resource.build_pub(post_list)
+        self.assertEqual(kwargs['using'], 'default')
+
+        # Writes make the client read from write_db for a while
+        kwargs['status'] = 201
+        response = self.resource.return_response(request, *args, **kwargs)
+        cookie = response.cookies[STICKY_WRITE_COOKIE]
+        self.assertEqual(cookie['max-age'], 5)
+        get_list.COOKIES[STICKY_WRITE_COOKIE] = cookie.value
+        self.assertEqual(self.resource.get_db_alias(get_list, ['get', 'list']), 'default')
+
+    def test_apply_filters_using(self):
+        Bar.objects.create(name='delta')
+        kwargs = {
+            'pub': ['get', 'list'],
+            'using': 'default',
+            'filters': {},
+        }
+        get_list = self.factory.get('/bar/')
+        request, args, kwargs = self.resource.apply_filters(get_list, [], **kwargs)
+        self.assertEqual(kwargs['objs'].db, 'default')
+        self.assertEqual(kwargs['objs'][0]._state.db, 'default')
+
+    def test_bulk_create(self):
+        self.resource.Meta.bulk_create = True
+        self.resource.Meta.bulk_create_batch_size = 2
+        can_bulk_create = self.resource._can_bulk_create(None)
+        self.assertEqual(can_bulk_create, can_return_bulk_ids(connections['default']))
+        self.resource.Meta.bulk_create = False
+        self.assertFalse(self.resource._can_bulk_create(None))
+
+        # Objects with primary keys can be bulk created anywhere
+        bundles = [{'obj': Bar(id=100 + i, name='bulk {0}'.format(i))} for i in range(5)]
+        # Inserts in batches of 2, read back in one lookup_batch_size batch
+        with self.assertNumQueries(4):
+            self.resource._bulk_create_bundles(bundles, None)
+        self.assertEqual(Bar.objects.filter(name__startswith='bulk').count(), 5)
+        self.assertEqual([bundle['obj'].name for bundle in bundles], ['bulk {0}'.format(i) for i in range(5)])
+        self.assertEqual(bundles[0]['obj']._state.db, 'default')
+
+    def test_post_list_bulk_create_fallback(self):
+        self.resource.Meta.bulk_create = True
+        kwargs = {
+            'pub': ['post', 'list'],
+            'bundles': [
+                {'obj': Bar(), 'request_data': {'name': 'first'}},
+                {'obj': Bar(), 'request_data': {'name': 'second'}},
+            ]
+        }
+        post_list = self.factory.post('/bar/', {})
+        request, args, kwargs = self.resource.update_objs_from_data(post_list, [], **kwargs)
+        self.assertTrue(kwargs['bundles'][0]['obj'].pk)
+        self.assertEqual(Bar.objects.filter(name__in=['first', 'second']).count(), 2)
+
+    def test_refresh_policy(self):
+        post_list = self.factory.post('/bar/', {})
+
+        def save_bars(policy):
+            self.resource.Meta.refresh_policy = policy
+            kwargs = {
+                'pub': ['post', 'list'],
+                'bundles': [
+                    {'obj': Bar(), 'request_data': {'name': 'first'}},
+                    {'obj': Bar(), 'request_data': {'name': 'second'}},
+                ]
+            }
+            request, args, kwargs = self.resource.update_objs_from_data(post_list, [], **kwargs)
+            return kwargs['bundles']
+
+        with self.assertNumQueries(4):
+            save_bars('each')
+        with self.assertNumQueries(3):
+            bundles = save_bars('bulk')
+        self.assertEqual(bundles[1]['obj'].name, 'second')
+        # Bar has no auto_now fields to reload
+        with self.assertNumQueries(2):
+            save_bars('auto_fields')
+        with self.assertNumQueries(2):
+            bundles = save_bars(None)
+        self.assertTrue(bundles[0]['obj'].pk)
+
+    def test_refresh_policy_auto_fields(self):
+        class FooResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                model = Foo
+                refresh_policy = 'auto_fields'
+        foo = Foo.objects.create(name='foo', text='text', integer=1, float_field=1.0, decimal='1.00', file_field='test.txt')
+        stale_foo = Foo.objects.get(pk=foo.pk)
+        stale_foo.created = None
+        with self.assertNumQueries(1):
+            FooResource()._refresh_bundles([{'obj': stale_foo}], 'auto_fields')
+        self.assertEqual(stale_foo.created, foo.created)
+        self.assertEqual(stale_foo.decimal, Decimal('1.00'))
+
+    def test_refresh_bundles(self):
+        bars = [Bar.objects.create(name='bar {0}'.format(i)) for i in range(3)]
+        self.resource.Meta.lookup_batch_size = 2
+        bundles = [{'obj': Bar(pk=bar.pk, name='stale')} for bar in bars]
+        deleted_obj = bundles[1]['obj']
+        bars[1].delete()
+        with self.assertNumQueries(2):
+            self.resource._refresh_bundles(bundles, 'bulk')
+        self.assertEqual(bundles[0]['obj'].name, 'bar 0')
+        # Objects deleted in the meantime keep their saved values
+        self.assertIs(bundles[1]['obj'], deleted_obj)
+        self.assertEqual(bundles[2]['obj'].name, 'bar 2')
+
+    def test_bundles_from_request_data_put_list(self):
+        bars = [Bar.objects.create(name='bar {0}'.format(i)) for i in range(5)]
+        self.resource.Meta.lookup_batch_size = 2
+        self.resource.Meta.select_for_update = True
+        put_list = self.factory.put('/bar/', {})
+        request_data = [{'id': str(bar.id), 'name': 'new name'} for bar in reversed(bars)]
+        # Duplicate keys get their own instance
+        request_data.append({'id': bars[0].id, 'name': 'again'})
+        kwargs = {
+            'pub': ['put', 'list'],
+            'request_data': request_data
+        }
+        with self.assertNumQueries(4):
+            request, args, kwargs = self.resource.bundles_from_request_data(put_list, [], **kwargs)
+        self.assertEqual([obj.id for obj in kwargs['objs']], [bar.id for bar in reversed(bars)] + [bars[0].id])
+        self.assertIsNot(kwargs['objs'][4], kwargs['objs'][5])
+
+        # The first bad item decides the error
+        kwargs = {
+            'pub': ['put', 'list'],
+            'request_data': [{'id': bars[0].id}, {'id': 9999}, {'name': 'no key'}]
+        }
+        with self.assertRaises(HttpInterrupt) as context:
+            self.resource.bundles_from_request_data(put_list, [], **kwargs)
+        self.assertIn('with key 9999 does not exist', context.exception.response.content.decode())
+        kwargs['request_data'] = [{'name': 'no key'}, {'id': 9999}]
+        with self.assertRaises(HttpInterrupt) as context:
+            self.resource.bundles_from_request_data(put_list, [], **kwargs)
+        self.assertIn('Data set missing id or key', context.exception.response.content.decode())
+
+    def _put_foos(self, update_policy, request_data):
+        class FooResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                model = Foo
+        FooResource.Meta.update_policy = update_policy
+        resource = FooResource()
+        put_list = self.factory.put('/foo/', {})
+        kwargs = {
+            'pub': ['put', 'list'],
+            'request_data': request_data
+        }
+        request, args, kwargs = resource.hydrate_request_data(put_list, [], **kwargs)
+        request, args, kwargs = resource.bundles_from_request_data(request, *args, **kwargs)
+        request, args, kwargs = resource.save_fk_objs(request, *args, **kwargs)
+        with CaptureQueriesContext(connections['default']) as queries:
+            request, args, kwargs = resource.update_objs_from_data(request, *args, **kwargs)
+        return kwargs['bundles'], queries.captured_queries
+
+    def _create_foos(self, count):
+        bar = Bar.objects.create(name='bar')
+        return [
+            Foo.objects.create(name='foo {0}'.format(i), text='text', integer=i, float_field=1.0, decimal='1.00', file_field='test.txt', bar=bar)
+            for i in range(count)
+        ]
+
+    def test_update_policy_changed(self):
+        foos = self._create_foos(2)
+        bundles, queries = self._put_foos('changed', [
+            {'id': foos[0].id, 'name': 'changed', 'integer': 0},
+            {'id': foos[1].id, 'name': 'foo 1', 'integer': 1},
+        ])
+        # One partial UPDATE and the refetch, the unchanged object is skipped
+        self.assertEqual(len(queries), 2)
+        self.assertIn('name', queries[0]['sql'])
+        self.assertNotIn('integer', queries[0]['sql'])
+        self.assertEqual(Foo.objects.get(id=foos[0].id).name, 'changed')
+
+    def test_update_policy_changed_dates(self):
+        foo = self._create_foos(1)[0]
+        created = timezone.localtime(foo.created).replace(tzinfo=None).isoformat()
+        # Naive datetimes and dates equal to the stored ones aren't written
+        bundles, queries = self._put_foos('changed', [
+            {'id': foo.id, 'created': created, 'birthday': foo.birthday.isoformat()},
+        ])
+        self.assertEqual(len(queries), 0)
+
+        bundles, queries = self._put_foos('changed', [
+            {'id': foo.id, 'created': '2020-01-01T00:00:00', 'birthday': '2020-01-02'},
+        ])
+        self.assertIn('created', queries[0]['sql'])
+        self.assertIn('birthday', queries[0]['sql'])
+        self.assertNotIn('name', queries[0]['sql'])
+        self.assertEqual(Foo.objects.get(id=foo.id).birthday, datetime.date(2020, 1, 2))
+
+    def test_update_policy_bulk(self):
+        foos = self._create_foos(3)
+        bar = Bar.objects.create(name='other bar')
+        bundles, queries = self._put_foos('bulk', [
+            {'id': foos[0].id, 'name': 'renamed 0'},
+            {'id': foos[1].id, 'name': 'renamed 1'},
+            {'id': foos[2].id, 'decimal': '2.50', 'bar': bar.id},
+        ])
+        # One UPDATE per set of changed columns and one refetch
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            [foo.name for foo in Foo.objects.filter(id__in=[foo.id for foo in foos]).order_by('id')],
+            ['renamed 0', 'renamed 1', 'foo 2']
+        )
+        updated_foo = Foo.objects.get(id=foos[2].id)
+        self.assertEqual(updated_foo.decimal, Decimal('2.50'))
+        self.assertEqual(updated_foo.bar_id, bar.id)
+        self.assertEqual(bundles[2]['obj'].decimal, Decimal('2.50'))
+
+    def test_save_m2m_objs_pks(self):
+        class FooResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                model = Foo
+        foo = self._create_foos(1)[0]
+        bazzes = [Baz.objects.create(name='baz {0}'.format(i)) for i in range(4)]
+        foo.bazzes.add(*bazzes[:3])
+        kwargs = {
+            'pub': ['put', 'detail'],
+            'bundles': [{
+                'obj': foo,
+                'request_data': {'bazzes': [str(bazzes[1].id), bazzes[2].id, bazzes[3].id, bazzes[3].id]}
+            }]
+        }
+        put_detail = self.factory.put('/foo/1/', {})
+        # Read the links, delete the stale one, then add checks and inserts the new one
+        with self.assertNumQueries(4):
+            FooResource().save_m2m_objs(put_detail, [], **kwargs)
+        self.assertEqual(
+            sorted(foo.bazzes.values_list('id', flat=True)),
+            [baz.id for baz in bazzes[1:]]
+        )
+
+    def test_save_related_many(self):
+        calls = []
+
+        class CountingResource(ModelResource):
+            def bundles_from_request_data(self, request, *args, **kwargs):
+                calls.append((self.Meta.model, kwargs['pub']))
+                return super(CountingResource, self).bundles_from_request_data(request, *args, **kwargs)
+
+        class BarResource(CountingResource):
+            class Meta(ModelResource.Meta):
+                model = Bar
+
+        class BazResource(CountingResource):
+            class Meta(ModelResource.Meta):
+                model = Baz
+
+        class FooResource(ModelResource):
+            class Meta(ModelResource.Meta):
+                model = Foo
+            class Fields:
+                bar = ForeignKeyField(attribute='bar', resource_cls=BarResource, embed=True)
+                bazzes = ManyToManyField(attribute='bazzes', resource_cls=BazResource, embed=True)
+
+        foo_resource = FooResource()
+        foo_resource.Meta.api = self.resource.Meta.api
+        foos = self._create_foos(3)
+        existing_baz = Baz.objects.create(name='existing baz')
+        kwargs = {
+            'pub': ['post', 'list'],
+            'bundles': [
+                {
+                    'obj': foo,
+                    'request_data': {
+                        'bar': {'name': 'new bar {0}'.format(i)},
+                        'bazzes': [{'name': 'new baz {0}'.format(i)}, {'id': existing_baz.id, 'name': 'existing baz'}],
+                    }
+                } for (i, foo) in enumerate(foos)
+            ]
+        }
+        post_list = self.factory.post('/foo/')
+        request, args, kwargs = foo_resource.save_fk_objs(post_list, [], **kwargs)
+        for bundle in kwargs['bundles']:
+            bundle['obj'].save()
+        request, args, kwargs = foo_resource.save_m2m_objs(post_list, [], **kwargs)
+
+        # New objects of each field are created in one post list run
+        self.assertEqual(calls.count((Bar, ['post', 'list'])), 1)
+        self.assertEqual(calls.count((Baz, ['post', 'list'])), 1)
+        self.assertEqual(calls.count((Baz, ['put', 'detail'])), 3)
+        for (i, foo) in enumerate(foos):
+            foo = Foo.objects.get(id=foo.id)
+            self.assertEqual(foo.bar.name, 'new bar {0}'.format(i))
+            self.assertEqual(
+                sorted(foo.bazzes.values_list('name', flat=True)),
+                ['existing baz', 'new baz {0}'.format(i)]
+            )
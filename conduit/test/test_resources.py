@@ -1,13 +1,22 @@
 import json
 
-from datetime import datetime
+from datetime import date, datetime
+from unittest import skipIf
 
 from django.contrib.contenttypes.models import ContentType
-
-from conduit.api import Api, fields
+from django.core.urlresolvers import reverse
+from django.db import connections
+from django.db.utils import ConnectionDoesNotExist
+from django.test.utils import CaptureQueriesContext
+
+import conduit.api.base
+import conduit.base
+from conduit.api import Api, fields, serializers
+from conduit.api.codecs import JSONCodec, encode_default
+from conduit.subscribe import match
 from conduit.test.testcases import ConduitTestCase
 
-from api.views import BarResource, ContentTypeResource, FooResource, ItemResource
+from api.views import BarResource, BazResource, ContentTypeResource, FooResource, ItemResource
 
 from example.models import Bar, Baz, Foo, Item
 
@@ -343,3 +352,584 @@ class ResourceTestCase(ConduitTestCase):
         self.assertTrue(content['id'])
         self.assertTrue(content['resource_uri'])
         self.assertEqual(content['content_object'], None)
+
+    def _create_foo(self, name):
+        foo = Foo.objects.create(
+            name=name,
+            text='',
+            integer=1,
+            float_field=1.0,
+            decimal='1.00',
+            file_field='test.txt',
+            bar=Bar.objects.create(name='Bar of {0}'.format(name))
+        )
+        foo.bazzes.add(Baz.objects.create(name='Baz of {0}'.format(name)))
+        return foo
+
+    def test_related_fields_prefetched(self):
+        foo_list_uri = self.foo_resource._get_resource_uri()
+        self._create_foo('Foo one')
+
+        connection = connections['default']
+        with CaptureQueriesContext(connection) as single:
+            self.client.get(foo_list_uri)
+
+        self._create_foo('Foo two')
+        self._create_foo('Foo three')
+        with CaptureQueriesContext(connection) as multiple:
+            response = self.client.get(foo_list_uri)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(len(multiple.captured_queries), len(single.captured_queries))
+        self.assertEqual(content['objects'][2]['bar']['name'], 'Bar of Foo three')
+        self.assertEqual(content['objects'][2]['bazzes'][0]['name'], 'Baz of Foo three')
+
+    def test_related_lookups_opt_out(self):
+        select_related, prefetch_related = self.foo_resource._get_related_lookups()
+        self.assertEqual(select_related, ['bar'])
+        self.assertEqual(prefetch_related, ['bazzes'])
+
+        class NoPrefetchFooResource(FooResource):
+            class Fields(FooResource.Fields):
+                bar = fields.ForeignKeyField(attribute='bar', resource_cls=BarResource, prefetch=False)
+        select_related, prefetch_related = NoPrefetchFooResource()._get_related_lookups()
+        self.assertEqual(select_related, [])
+
+    def test_gfk_list_prefetched(self):
+        foo_ctype = ContentType.objects.get(model='foo')
+        get_list = self.factory.get(self.item_resource._get_resource_uri())
+
+        def create_items():
+            bar = Bar.objects.create(name='Bar')
+            Item.objects.create(content_type=self.bar_ctype, object_id=bar.id)
+            foo = self._create_foo('Foo')
+            Item.objects.create(content_type=foo_ctype, object_id=foo.id)
+
+        def dehydrate_items():
+            kwargs = {
+                'pub': ['get', 'list'],
+                'bundles': [
+                    {'obj': item, 'response_data': {}}
+                    for item in Item.objects.order_by('id')
+                ]
+            }
+            with CaptureQueriesContext(connections['default']) as queries:
+                request, args, kwargs = self.item_resource.dehydrate_explicit_fields(get_list, **kwargs)
+            return kwargs['bundles'], len(queries.captured_queries)
+
+        create_items()
+        # Warm up the ContentType cache
+        dehydrate_items()
+        bundles, single_queries = dehydrate_items()
+
+        create_items()
+        create_items()
+        bundles, multiple_queries = dehydrate_items()
+
+        self.assertEqual(multiple_queries, single_queries)
+        self.assertEqual(bundles[4]['response_data']['content_object']['name'], 'Bar')
+        self.assertEqual(bundles[5]['response_data']['content_object']['bar']['name'], 'Bar of Foo')
+
+    def test_gfk_list_detail_auth(self):
+        checked = []
+
+        class DetailAuthBarResource(BarResource):
+            @match(match=['get', 'detail'])
+            def auth_get_detail(self, request, *args, **kwargs):
+                checked.append([bundle['obj'].name for bundle in kwargs['bundles']])
+                if kwargs['bundles'][0]['obj'].name == 'Secret':
+                    self.forbidden()
+                return (request, args, kwargs)
+
+        class DetailAuthItemResource(ItemResource):
+            class Fields:
+                content_object = fields.GenericForeignKeyField(
+                    attribute='content_object',
+                    resource_map={'Bar': DetailAuthBarResource},
+                    embed=True
+                )
+
+        for name in ('Bar one', 'Bar two'):
+            bar = Bar.objects.create(name=name)
+            Item.objects.create(content_type=self.bar_ctype, object_id=bar.id)
+        resource = DetailAuthItemResource()
+        self.foo_resource.Meta.api.register(resource)
+        list_uri = self.item_resource._get_resource_uri()
+        response = resource.view(self.factory.get(list_uri))
+        names = [data['content_object']['name'] for data in json.loads(response.content.decode())['objects']]
+        self.assertEqual(sorted(names), ['Bar one', 'Bar two'])
+        # Embedded objects are authorized one detail at a time
+        self.assertEqual(sorted(checked), [['Bar one'], ['Bar two']])
+
+        bar = Bar.objects.create(name='Secret')
+        Item.objects.create(content_type=self.bar_ctype, object_id=bar.id)
+        response = resource.view(self.factory.get(list_uri))
+        self.assertEqual(response.status_code, 403)
+
+    def test_stage_timing(self):
+        class TimedBarResource(BarResource):
+            class Meta(BarResource.Meta):
+                timing = True
+                slow_request_threshold = 0
+
+        warnings = []
+
+        class WarningLogger(object):
+            def isEnabledFor(self, level):
+                return False
+
+            def warning(self, message):
+                warnings.append(message)
+
+        resource = TimedBarResource()
+        Api(name='v1').register(resource)
+        Bar.objects.create(name='Timed bar')
+        # Logging is disabled while testing
+        logger = conduit.base.logger
+        conduit.base.logger = WarningLogger()
+        try:
+            response = resource.view(self.factory.get(resource._get_resource_uri()))
+        finally:
+            conduit.base.logger = logger
+
+        server_timing = response['Server-Timing']
+        self.assertIn('apply_filters;dur=', server_timing)
+        self.assertIn('return_response;dur=', server_timing)
+        self.assertIn('total;dur=', server_timing)
+        # Stages skipped for a get list are not timed
+        self.assertNotIn('auth_put_detail', server_timing)
+        self.assertEqual(len(warnings), 1)
+        self.assertIn('TimedBarResource', warnings[0])
+
+    def test_no_stage_timing(self):
+        response = self.bar_resource.view(self.factory.get(self.bar_resource._get_resource_uri()))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_decode_uri(self):
+        api = self.bar_resource.Meta.api
+        bar_uri = self.bar_resource._get_resource_uri(obj=Bar(id=5))
+        self.assertEqual(api.decode_uri(bar_uri), (self.bar_resource, '5'))
+        self.assertEqual(api.decode_uri(bar_uri + '?format=json'), (self.bar_resource, '5'))
+        self.assertEqual(api.decode_uri(self.bar_resource._get_resource_uri()), None)
+        self.assertEqual(api.decode_uri('/elsewhere/5/'), None)
+
+    def test_resource_uri_template(self):
+        api = self.bar_resource.Meta.api
+        list_view_name, detail_view_name = self.bar_resource._get_view_names()
+        self.assertEqual(
+            self.bar_resource._get_resource_uri(obj=Bar(id=5)),
+            reverse(detail_view_name, kwargs={'id': 5})
+        )
+        self.assertEqual(self.bar_resource._get_resource_uri(), reverse(list_view_name))
+
+        # Later uris only format the cached templates
+        reversed_names = []
+        original_reverse = conduit.api.base.reverse
+
+        def counting_reverse(view_name, *args, **kwargs):
+            reversed_names.append(view_name)
+            return original_reverse(view_name, *args, **kwargs)
+
+        conduit.api.base.reverse = counting_reverse
+        try:
+            uris = [self.bar_resource._get_resource_uri(obj=Bar(id=pk)) for pk in range(10)]
+            self.bar_resource._get_resource_uri()
+        finally:
+            conduit.api.base.reverse = original_reverse
+        self.assertEqual(reversed_names, [])
+        self.assertEqual(uris[7], reverse(detail_view_name, kwargs={'id': 7}))
+        self.assertEqual(api.decode_uri(uris[7]), (self.bar_resource, '7'))
+
+    def test_codec(self):
+        class NativeDateCodec(JSONCodec):
+            native_types = (datetime, date)
+
+        class NativeFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                codec = NativeDateCodec()
+
+        foo = self._create_foo('Foo one')
+        resource = NativeFooResource()
+        self.foo_resource.Meta.api.register(resource)
+        self.assertIsInstance(resource._get_codec(), NativeDateCodec)
+        self.assertIsInstance(self.foo_resource._get_codec(), JSONCodec)
+        self.assertEqual(Api(codec='notinstalled').codec, 'notinstalled')
+
+        request = self.factory.get(self.foo_resource._get_resource_uri())
+        kwargs = {'pub': ['get', 'detail'], 'bundles': [{'obj': foo}]}
+        response_data = resource.response_data_from_bundles(request, **kwargs)[2]['bundles'][0]['response_data']
+        # Dates are handed to the codec as they are, the output doesn't change
+        self.assertIsInstance(response_data['created'], datetime)
+        response = self.foo_resource.view(request, id=foo.id)
+        native_response = resource.view(request, id=foo.id)
+        self.assertEqual(json.loads(native_response.content.decode()), json.loads(response.content.decode()))
+
+    def test_streaming_get_list(self):
+        chunks = []
+
+        class StreamingFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                streaming = True
+                stream_chunk_size = 3
+                serializers = ('json', 'ndjson')
+
+            def auth_get_list(self, request, *args, **kwargs):
+                chunks.append(len(kwargs['bundles']))
+                return request, args, kwargs
+
+        for i in range(8):
+            self._create_foo('Foo {0}'.format(i))
+        resource = StreamingFooResource()
+        self.foo_resource.Meta.api.register(resource)
+
+        query_counts = []
+        for query in ('?limit=20', '?limit=5&offset=2', '?limit=20&offset=8'):
+            request = self.factory.get(self.foo_resource._get_resource_uri() + query)
+            response = self.foo_resource.view(request)
+            with CaptureQueriesContext(connections['default']) as queries:
+                streaming_response = resource.view(request)
+                content = b''.join(streaming_response.streaming_content)
+            query_counts.append(len(queries))
+            self.assertTrue(streaming_response.streaming)
+            self.assertEqual(json.loads(content.decode()), json.loads(response.content.decode()))
+
+        # The count, the objects and a bazzes prefetch per chunk
+        self.assertEqual(query_counts, [5, 4, 2])
+        self.assertEqual(chunks, [3, 3, 2, 3, 2, 0])
+
+        request = self.factory.get(self.foo_resource._get_resource_uri() + '?limit=20&format=ndjson')
+        content = b''.join(resource.view(request).streaming_content)
+        self.assertEqual(len(content.splitlines()), 8)
+
+    def test_limited_get_list_prefetch(self):
+        foos = [self._create_foo('Foo {0}'.format(i)) for i in range(6)]
+        request = self.factory.get(self.foo_resource._get_resource_uri() + '?limit=2&offset=1')
+        with CaptureQueriesContext(connections['default']) as queries:
+            response = self.foo_resource.view(request)
+        data = json.loads(response.content.decode())
+        self.assertEqual([len(obj_data['bazzes']) for obj_data in data['objects']], [1, 1])
+        # The count, the objects and a bazzes prefetch for the page alone
+        self.assertEqual(len(queries), 3)
+        prefetch_sql = queries.captured_queries[2]['sql']
+        self.assertIn('example_baz', prefetch_sql)
+        page_ids = prefetch_sql[prefetch_sql.rindex(' IN (') + 5:].split(')')[0].split(', ')
+        self.assertEqual(sorted(page_ids), sorted([str(foo.id) for foo in foos[1:3]]))
+
+    def test_embedded_streaming_resource(self):
+        class StreamingBazResource(BazResource):
+            class Meta(BazResource.Meta):
+                streaming = True
+                stream_chunk_size = 2
+
+        class EmbedFooResource(FooResource):
+            class Fields:
+                bazzes = fields.ManyToManyField(
+                    attribute='bazzes',
+                    resource_cls=StreamingBazResource,
+                    embed=True
+                )
+
+        foo = self._create_foo('Foo one')
+        for i in range(4):
+            foo.bazzes.add(Baz.objects.create(name='Baz {0}'.format(i)))
+        resource = EmbedFooResource()
+        self.foo_resource.Meta.api.register(resource)
+        self.foo_resource.Meta.api.register(StreamingBazResource())
+
+        # Embedded lists are never cut to the first chunk
+        response = resource.view(self.factory.get(self.foo_resource._get_resource_uri()))
+        data = json.loads(response.content.decode())
+        self.assertEqual(len(data['objects'][0]['bazzes']), 5)
+        response = resource.view(self.factory.get(self.foo_resource._get_resource_uri(obj=foo)), id=foo.id)
+        self.assertEqual(len(json.loads(response.content.decode())['bazzes']), 5)
+
+    def test_streaming_default_chunk_size(self):
+        chunks = []
+
+        class StreamingFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                streaming = True
+
+            def auth_get_list(self, request, *args, **kwargs):
+                chunks.append(len(kwargs['bundles']))
+                return request, args, kwargs
+
+        for i in range(StreamingFooResource.Meta.stream_chunk_size + 1):
+            self._create_foo('Foo {0}'.format(i))
+        resource = StreamingFooResource()
+        self.foo_resource.Meta.api.register(resource)
+        query = '?limit={0}'.format(StreamingFooResource.Meta.max_limit)
+        response = resource.view(self.factory.get(self.foo_resource._get_resource_uri() + query))
+        content = b''.join(response.streaming_content)
+        self.assertEqual(len(json.loads(content.decode())['objects']), StreamingFooResource.Meta.stream_chunk_size + 1)
+        # A full page under the default max_limit takes several chunks
+        self.assertEqual(chunks, [StreamingFooResource.Meta.stream_chunk_size, 1])
+
+    def test_content_negotiation(self):
+        class FormatsFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                serializers = ('json', 'ndjson', 'csv')
+
+        class FormatsBarResource(BarResource):
+            class Meta(BarResource.Meta):
+                serializers = ('json', 'ndjson', 'csv')
+
+        self._create_foo('Foo one')
+        list_uri = self.foo_resource._get_resource_uri()
+
+        # Resources only offer JSON unless they opt in to other formats
+        response = self.foo_resource.view(self.factory.get(list_uri, HTTP_ACCEPT='text/csv'))
+        self.assertEqual(response.status_code, 406)
+        self.foo_resource = FormatsFooResource()
+        self.bar_resource = FormatsBarResource()
+        self.foo_resource.Meta.api.register(self.foo_resource)
+        self.foo_resource.Meta.api.register(self.bar_resource)
+
+        response = self.foo_resource.view(self.factory.get(list_uri, HTTP_ACCEPT='text/html, */*;q=0.8'))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('Accept', response['Vary'])
+        data = json.loads(response.content.decode())
+
+        response = self.foo_resource.view(self.factory.get(list_uri, HTTP_ACCEPT='text/csv'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = response.content.decode('utf-8').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('resource_uri', lines[0].split(','))
+
+        response = self.foo_resource.view(self.factory.get(list_uri + '?format=ndjson'))
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(json.loads(response.content.decode()), data['objects'][0])
+
+        for request in (self.factory.get(list_uri, HTTP_ACCEPT='image/png'), self.factory.get(list_uri + '?format=xml')):
+            response = self.foo_resource.view(request)
+            self.assertEqual(response.status_code, 406)
+
+        # Request bodies are read by their Content-Type
+        bar_uri = self.bar_resource._get_resource_uri()
+        body = b'{"name": "Bar one"}\n{"name": "Bar two"}\n'
+        response = self.bar_resource.view(self.factory.post(bar_uri, body, content_type='application/x-ndjson'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Bar.objects.filter(name__in=['Bar one', 'Bar two']).count(), 2)
+        response = self.bar_resource.view(self.factory.post(bar_uri, b'name\nBar', content_type='text/csv'))
+        self.assertEqual(response.status_code, 415)
+
+        # JSON bodies are read even when responses can't be JSON
+        class NDJSONBarResource(BarResource):
+            class Meta(BarResource.Meta):
+                serializers = ('ndjson',)
+
+        resource = NDJSONBarResource()
+        self.foo_resource.Meta.api.register(resource)
+        for content_type in ('application/json', 'text/plain'):
+            response = resource.view(self.factory.post(bar_uri, b'{"name": "Bar three"}', content_type=content_type))
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(Bar.objects.filter(name='Bar three').count(), 2)
+        response = resource.view(self.factory.post(bar_uri, b'name\nBar', content_type='text/csv'))
+        self.assertEqual(response.status_code, 415)
+
+    def test_serializers_not_installed(self):
+        class MissingFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                serializers = ('missing',)
+
+        self._create_foo('Foo one')
+        resource = MissingFooResource()
+        self.foo_resource.Meta.api.register(resource)
+        list_uri = self.foo_resource._get_resource_uri()
+        response = resource.view(self.factory.get(list_uri))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(response.content.decode())['meta']['total'], 1)
+        response = resource.view(self.factory.get(list_uri + '?format=missing'))
+        self.assertEqual(response.status_code, 406)
+
+    def test_columns_layout(self):
+        class StreamingFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                streaming = True
+                stream_chunk_size = 2
+                serializers = ('json', 'csv')
+
+        for i in range(3):
+            self._create_foo('Foo {0}'.format(i))
+        streaming_resource = StreamingFooResource()
+        self.foo_resource.Meta.api.register(streaming_resource)
+        list_uri = self.foo_resource._get_resource_uri()
+
+        response = self.foo_resource.view(self.factory.get(list_uri))
+        objects_data = json.loads(response.content.decode())
+        response = self.foo_resource.view(self.factory.get(list_uri + '?layout=columns'))
+        data = json.loads(response.content.decode())
+        self.assertEqual(sorted(data.keys()), ['columns', 'meta', 'rows'])
+        self.assertEqual(data['meta']['uri'], list_uri + '?layout=columns')
+        self.assertEqual(data['meta']['total'], objects_data['meta']['total'])
+        # Model fields first, in plan order
+        plan = self.foo_resource._get_dehydration_plan(Foo.objects.all()[0])
+        self.assertEqual(data['columns'][:len(plan)], [fieldname for (fieldname, converter,) in plan])
+        self.assertIn('resource_uri', data['columns'])
+        for (row, obj_data,) in zip(data['rows'], objects_data['objects']):
+            self.assertEqual(dict([item for item in zip(data['columns'], row) if item[1] is not None]), obj_data)
+
+        streamed = b''.join(streaming_resource.view(self.factory.get(list_uri + '?layout=columns')).streaming_content)
+        self.assertEqual(json.loads(streamed.decode()), data)
+
+        streamed = b''.join(streaming_resource.view(self.factory.get(list_uri + '?layout=columns&format=csv')).streaming_content)
+        self.assertEqual(streamed.decode('utf-8').splitlines()[0], ','.join(data['columns']))
+
+        response = self.foo_resource.view(self.factory.get(list_uri + '?layout=tables'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_values(self):
+        foos = [self._create_foo('Foo {0}'.format(i)) for i in range(5)]
+        fields = self.foo_resource._get_export_fields()
+        names = [name for (name, field,) in fields]
+        self.assertIn('bar', names)
+        self.assertNotIn('bazzes', names)
+        plan = self.foo_resource._get_dehydration_plan(foos[0])
+        plan_names = [fieldname for (fieldname, converter,) in plan]
+        self.assertEqual([name for name in names if name in plan_names], plan_names)
+
+        self.foo_resource.Meta.stream_chunk_size = 2
+        try:
+            chunks = list(self.foo_resource._iter_value_chunks(Foo.objects.order_by('id'), fields))
+            list_chunks = list(self.foo_resource._iter_value_chunks(list(Foo.objects.order_by('id')), fields))
+        finally:
+            del self.foo_resource.Meta.stream_chunk_size
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(chunks, list_chunks)
+        self.assertEqual(chunks[0][0][names.index('bar')], foos[0].bar_id)
+
+    @skipIf(serializers.pyarrow is None, 'pyarrow is not installed')
+    def test_arrow_get_list(self):
+        import pyarrow
+
+        class ExportFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                serializers = ('json', 'arrow')
+                stream_chunk_size = 2
+                default_filters = {'integer': 1}
+
+            def auth_get_list_queryset(self, request, queryset, *args, **kwargs):
+                return queryset.exclude(name='Foo 0')
+
+        for i in range(5):
+            self._create_foo('Foo {0}'.format(i))
+        Foo.objects.filter(name='Foo 4').update(integer=2)
+        resource = ExportFooResource()
+        self.foo_resource.Meta.api.register(resource)
+        list_uri = self.foo_resource._get_resource_uri()
+
+        response = resource.view(self.factory.get(list_uri, HTTP_ACCEPT='application/vnd.apache.arrow.stream'))
+        reader = pyarrow.ipc.open_stream(b''.join(response.streaming_content))
+        table = reader.read_all()
+        self.assertEqual(sorted(table.column('name').to_pylist()), ['Foo 1', 'Foo 2', 'Foo 3'])
+        self.assertEqual(table.schema.field('integer').type, pyarrow.int64())
+        self.assertEqual(json.loads(reader.schema.metadata[b'conduit.meta'].decode())['total'], 3)
+
+        if serializers.parquet is not None:
+            resource.Meta.serializers = ('json', 'arrow', 'parquet')
+            response = resource.view(self.factory.get(list_uri + '?format=parquet'))
+            table = serializers.parquet.read_table(pyarrow.BufferReader(b''.join(response.streaming_content)))
+            self.assertEqual(table.num_rows, 3)
+
+        # Only get requests can be exported
+        response = resource.view(self.factory.post(list_uri + '?format=arrow', b'{"name": "Foo"}', content_type='application/json'))
+        self.assertEqual(response.status_code, 406)
+
+    def test_export_needs_queryset_auth(self):
+        class ValuesSerializer(serializers.Serializer):
+            format = 'values'
+            media_types = ('application/x-values',)
+            can_load = False
+            from_queryset = True
+
+            def stream_values(self, resource, fields, value_chunks, meta=None):
+                for rows in value_chunks:
+                    yield json.dumps(rows, default=encode_default).encode('utf-8')
+
+        class BundleAuthFooResource(FooResource):
+            class Meta(FooResource.Meta):
+                serializers = ('json', 'values')
+
+            def auth_get_list(self, request, *args, **kwargs):
+                kwargs['bundles'] = [bundle for bundle in kwargs['bundles'] if bundle['obj'].name != 'Foo 0']
+                return (request, args, kwargs)
+
+        class QuerysetAuthFooResource(BundleAuthFooResource):
+            def auth_get_list_queryset(self, request, queryset, *args, **kwargs):
+                return queryset.exclude(name='Foo 0')
+
+        for i in range(3):
+            self._create_foo('Foo {0}'.format(i))
+        list_uri = self.foo_resource._get_resource_uri()
+        serializers.register(ValuesSerializer())
+        try:
+            # The values would skip the bundles auth_get_list filters
+            resource = BundleAuthFooResource()
+            self.foo_resource.Meta.api.register(resource)
+            response = resource.view(self.factory.get(list_uri + '?format=values'))
+            self.assertEqual(response.status_code, 406)
+            response = resource.view(self.factory.get(list_uri, HTTP_ACCEPT='application/x-values'))
+            self.assertEqual(response.status_code, 406)
+            response = resource.view(self.factory.get(list_uri))
+            names = [data['name'] for data in json.loads(response.content.decode())['objects']]
+            self.assertEqual(sorted(names), ['Foo 1', 'Foo 2'])
+
+            resource = QuerysetAuthFooResource()
+            self.foo_resource.Meta.api.register(resource)
+            response = resource.view(self.factory.get(list_uri + '?format=values'))
+            self.assertEqual(response.status_code, 200)
+            rows = json.loads(b''.join(response.streaming_content).decode())
+            names = [name for (name, field,) in resource._get_export_fields()]
+            self.assertEqual(sorted([row[names.index('name')] for row in rows]), ['Foo 1', 'Foo 2'])
+        finally:
+            del serializers.serializers['values']
+
+    def test_related_uris_fetched_in_bulk(self):
+        baz_resource = BazResource()
+        self.foo_resource.Meta.api.register(baz_resource)
+        bazzes = [Baz.objects.create(name='Baz {0}'.format(i)) for i in range(6)]
+        baz_uris = [baz_resource._get_resource_uri(obj=baz) for baz in bazzes]
+        bar = Bar.objects.create(name='Bar')
+        bar_uri = self.bar_resource._get_resource_uri(obj=bar)
+        put_list = self.factory.put(self.foo_resource._get_resource_uri())
+
+        def save_related(uri_count):
+            foos = [self._create_foo('Foo {0}'.format(i)) for i in range(2)]
+            kwargs = {
+                'pub': ['put', 'list'],
+                'bundles': [
+                    {'obj': foo, 'request_data': {'bar': bar_uri, 'bazzes': baz_uris[:uri_count]}}
+                    for foo in foos
+                ]
+            }
+            with CaptureQueriesContext(connections['default']) as queries:
+                self.foo_resource.save_fk_objs(put_list, **kwargs)
+                self.foo_resource.save_m2m_objs(put_list, **kwargs)
+            for foo in foos:
+                self.assertEqual(foo.bar, bar)
+                self.assertEqual(foo.bazzes.count(), uri_count)
+            return len(queries.captured_queries)
+
+        self.assertEqual(save_related(2), save_related(6))
+
+    def test_related_uris_use_request_alias(self):
+        bar_uri = self.bar_resource._get_resource_uri(obj=Bar.objects.create(name='Bar'))
+        put_list = self.factory.put(self.foo_resource._get_resource_uri())
+        # Looking up related uris on the alias of the request, which doesn't exist
+        for count in (1, 2):
+            kwargs = {
+                'pub': ['put', 'list'],
+                'using': 'missing',
+                'bundles': [
+                    {'obj': self._create_foo('Foo {0}'.format(i)), 'request_data': {'bar': bar_uri}}
+                    for i in range(count)
+                ]
+            }
+            with self.assertRaises(ConnectionDoesNotExist):
+                self.foo_resource.save_fk_objs(put_list, **kwargs)
+
+        field = self.foo_resource._get_explicit_field_by_attribute('bar')
+        args, kwargs = field.build_obj_and_kwargs({'name': 'New bar'}, using='default')
+        self.assertEqual(kwargs['using'], 'default')
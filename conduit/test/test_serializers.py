@@ -0,0 +1,68 @@
+import datetime
+from decimal import Decimal
+from unittest import skipIf
+
+from conduit.api import serializers
+from conduit.api.serializers import parse_accept
+from conduit.test.testcases import ConduitTestCase
+
+from api.views import BarResource
+
+
+class SerializerTestCase(ConduitTestCase):
+
+    def setUp(self):
+        self.resource = BarResource()
+
+    def test_parse_accept(self):
+        accept = 'text/html, application/json;q=0.9, text/csv, */*;q=0.1, image/png;q=0'
+        self.assertEqual(parse_accept(accept), ['text/html', 'text/csv', 'application/json', '*/*'])
+        self.assertEqual(parse_accept(''), [])
+
+    def test_ndjson(self):
+        serializer = serializers.serializers['ndjson']
+        response_data = {'meta': {'total': 2}, 'objects': [{'id': 1}, {'id': 2}]}
+        content = serializer.dumps(self.resource, response_data, ['get', 'list'])
+        self.assertEqual(content.splitlines(), [b'{"id": 1}', b'{"id": 2}'])
+        self.assertEqual(serializer.loads(self.resource, content), [{'id': 1}, {'id': 2}])
+        self.assertEqual(serializer.loads(self.resource, b'{"id": 1}\n'), {'id': 1})
+        self.assertEqual(serializer.dumps(self.resource, '', ['delete', 'detail']), b'')
+
+    def test_csv(self):
+        serializer = serializers.serializers['csv']
+        self.assertFalse(serializer.can_load)
+        rows = [
+            {'name': u'caf\xe9, bar', 'created': datetime.datetime(2014, 1, 2, 3, 4, 5), 'bazzes': [1, 2]},
+            {'name': 'b', 'created': None, 'decimal': Decimal('1.10')},
+        ]
+        columns = list(rows[0].keys())
+        content = serializer.dumps(self.resource, {'meta': {}, 'objects': rows}, ['get', 'list'])
+        lines = content.decode('utf-8').splitlines()
+        self.assertEqual(lines[0], ','.join(columns))
+        cells = {
+            'name': u'"caf\xe9, bar"',
+            'created': '2014-01-02T03:04:05',
+            'bazzes': '"[1, 2]"',
+        }
+        self.assertEqual(lines[1], ','.join([cells[column] for column in columns]))
+        # Columns come from the first object
+        self.assertEqual(lines[2], ','.join([{'name': 'b', 'created': '', 'bazzes': ''}[column] for column in columns]))
+
+    def test_stream(self):
+        chunks = [[{'id': 1}], [], [{'id': 2}, {'id': 3}]]
+        response_data = {'meta': {'total': 3}, 'objects': chunks[0]}
+        for (name, serializer,) in serializers.serializers.items():
+            if serializer.from_queryset:
+                continue
+            streamed = b''.join(serializer.stream(self.resource, response_data, iter(chunks)))
+            whole = serializer.dumps(self.resource, {'meta': {'total': 3}, 'objects': [{'id': 1}, {'id': 2}, {'id': 3}]}, ['get', 'list'])
+            if name == 'json':
+                self.assertEqual(serializer.loads(self.resource, streamed), serializer.loads(self.resource, whole))
+            else:
+                self.assertEqual(streamed, whole, name)
+
+    @skipIf(serializers.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        serializer = serializers.serializers['msgpack']
+        content = serializer.dumps(self.resource, {'created': datetime.date(2014, 1, 2), 'name': u'caf\xe9'}, ['get', 'detail'])
+        self.assertEqual(serializer.loads(self.resource, content), {'created': '2014-01-02', 'name': u'caf\xe9'})
@@ -0,0 +1,59 @@
+from functools import wraps
+
+from conduit.api import ModelResource
+from conduit.api.fields import ForeignKeyField
+from conduit.subscribe import match, specialize, subscribe
+from conduit.test.testcases import ConduitTestCase
+
+from api.views import BarResource
+
+
+class SubscribeTestCase(ConduitTestCase):
+
+    def test_specialize(self):
+        plan = ModelResource._get_plan()
+        specialized = specialize(plan, ['get', 'detail'])
+        names = [method.__name__ for method in specialized]
+        self.assertIn('auth_get_detail', names)
+        self.assertNotIn('auth_get_list', names)
+        self.assertNotIn('auth_put_detail', names)
+        self.assertNotIn('json_to_python', names)
+        # Matching methods are unwrapped
+        get_object = ModelResource.__dict__['get_object_from_kwargs']
+        self.assertIn(get_object.pub_rule[2], specialized)
+        self.assertNotIn(get_object, specialized)
+
+    def test_specialize_field_conduit(self):
+        plan = BarResource._get_plan(ForeignKeyField.dehydrate_conduit)
+        names = [method.__name__ for method in specialize(plan, ['detail', 'get'])]
+        self.assertEqual(names, [
+            'bundles_from_objs',
+            'auth_get_detail',
+            'response_data_from_bundles',
+            'dehydrate_explicit_fields',
+            'add_resource_uri',
+        ])
+
+    def test_specialize_keeps_outer_decorators(self):
+        def outer(func):
+            @wraps(func)
+            def wrapper(self, request, *args, **kwargs):
+                return func(self, request, *args, **kwargs)
+            return wrapper
+
+        @outer
+        @subscribe(sub=['get'])
+        def stage(self, request, *args, **kwargs):
+            return request, args, kwargs
+
+        self.assertEqual(specialize((stage,), ['get']), (stage,))
+        self.assertEqual(specialize((stage,), ['put']), (stage,))
+
+    def test_specialize_stacked(self):
+        @match(match=['get'])
+        @subscribe(sub=['list'])
+        def stage(self, request, *args, **kwargs):
+            return request, args, kwargs
+
+        self.assertEqual(specialize((stage,), ['get', 'detail']), ())
+        self.assertEqual(len(specialize((stage,), ['get', 'list'])), 1)